@@ -0,0 +1,76 @@
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Optional
+
+from sqlalchemy import select, update, func, not_
+
+from db import async_session_factory, Document
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory lock: в каждый момент согласование выполняет только один воркер
+APPROVAL_LOCK_KEY = 0x45545544  # "ETUD"
+
+
+class ApprovalScheduler:
+    """Автоматически согласует документы, ожидающие дольше заданного времени.
+
+    Вместо отдельной задачи на каждый документ воркеры периодически опрашивают
+    частичный индекс по created_at для несогласованных документов и согласуют
+    просроченные пачками. Так отложенные согласования переживают перезапуск воркеров.
+    """
+
+    def __init__(self):
+        self.approval_delay = None
+        self.poll_interval = None
+        self.batch_size = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def approve_overdue(self) -> int:
+        """Согласует все просроченные документы, возвращает их количество"""
+        approved = 0
+        while True:
+            async with async_session_factory() as session:
+                # Блокировка транзакционная и освобождается при commit
+                locked = await session.scalar(select(func.pg_try_advisory_xact_lock(APPROVAL_LOCK_KEY)))
+                if not locked:
+                    return approved
+
+                overdue = (
+                    select(Document.id)
+                    .where(not_(Document.isApproval) & (Document.created_at < func.now() - self.approval_delay))
+                    .order_by(Document.created_at)
+                    .limit(self.batch_size)
+                    .with_for_update(skip_locked=True)
+                )
+                result = await session.execute(
+                    update(Document)
+                    .where(Document.id.in_(overdue))
+                    .values(isApproval=True)
+                    .execution_options(synchronize_session=False)
+                )
+                await session.commit()
+
+            approved += result.rowcount
+            if result.rowcount < self.batch_size:
+                return approved
+
+    async def _run(self):
+        while True:
+            try:
+                await self.approve_overdue()
+            except Exception:
+                logger.exception("Auto approval failed")
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self, approval_delay: float, poll_interval: float, batch_size: int):
+        self.approval_delay = timedelta(seconds=approval_delay)
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import async_session_factory, AuthToken
+
+logger = logging.getLogger(__name__)
+
+
+async def redeem_auth_code(db: AsyncSession, code: str, client_id: str, redirect_uri: Optional[str]):
+    """Погашает код авторизации одним DELETE ... RETURNING.
+
+    Код удаляется только если он не истек и выдан этому клиенту для этого redirect_uri,
+    поэтому повторно использовать его нельзя, а чужой запрос не может его сжечь.
+    Возвращает (email, scopes) или None.
+    """
+    if not code:
+        return None
+
+    result = await db.execute(
+        delete(AuthToken)
+        .where(
+            AuthToken.code == code,
+            AuthToken.expires_at > datetime.utcnow(),
+            AuthToken.client_id == client_id,
+            AuthToken.redirect_uri == redirect_uri
+        )
+        .returning(AuthToken.email, AuthToken.scopes)
+    )
+    return result.first()
+
+
+class AuthCodePurger:
+    """Периодически удаляет истекшие коды авторизации, которые так и не обменяли на токены"""
+
+    def __init__(self):
+        self.interval = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def purge_expired(self) -> int:
+        async with async_session_factory() as session:
+            result = await session.execute(delete(AuthToken).where(AuthToken.expires_at <= datetime.utcnow()))
+            await session.commit()
+        return result.rowcount
+
+    async def _run(self):
+        while True:
+            try:
+                await self.purge_expired()
+            except Exception:
+                logger.exception("Auth code purge failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self, interval: float):
+        self.interval = interval
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
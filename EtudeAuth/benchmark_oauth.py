@@ -0,0 +1,314 @@
+# benchmark_oauth.py
+"""Нагрузочный тест OAuth потоков.
+
+Прогоняет полный authorization code flow (authorize -> login -> token -> validate),
+цепочки обновления по refresh token и вход по email с заданной конкурентностью и
+сохраняет p50/p95/p99 и req/s по каждому эндпоинту в JSON для сравнения между релизами.
+
+По умолчанию приложение запускается в этом же процессе (httpx + ASGI, с lifespan);
+с --base-url нагрузка подается на уже запущенный сервер (например, gunicorn с воркерами).
+Данные: organization_data.json из organization_seed.py, импорт через --seed (данные таблиц удаляются,
+схема и триггеры миграций сохраняются).
+
+    python benchmark_oauth.py --seed --flows 500 --concurrency 20 --output bench.json
+    python benchmark_oauth.py --flows 500 --compare bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+# Журнал запросов в stdout исказил бы замеры (и вывод отчета) - по умолчанию только предупреждения
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from config import settings  # noqa: E402
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Перцентиль по ближайшему рангу"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(p / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Recorder:
+    """Задержки и ошибки по эндпоинтам одной фазы"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    async def request(self, client: httpx.AsyncClient, endpoint: str, method: str, url: str,
+                      expected_status: int, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            response = None
+        self.latencies.setdefault(endpoint, []).append(time.perf_counter() - started)
+        if response is None or response.status_code != expected_status:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            return None
+        return response
+
+    def summary(self) -> dict:
+        duration = (self.finished or time.perf_counter()) - self.started
+        endpoints = {}
+        for endpoint, values in self.latencies.items():
+            values = sorted(values)
+            stats = {
+                "requests": len(values),
+                "errors": self.errors.get(endpoint, 0),
+                "rps": round(len(values) / duration, 1) if duration else 0.0,
+                "mean_ms": round(sum(values) / len(values) * 1000, 2),
+                "max_ms": round(values[-1] * 1000, 2),
+            }
+            for p in PERCENTILES:
+                stats[f"p{p}_ms"] = round(percentile(values, p) * 1000, 2)
+            endpoints[endpoint] = stats
+        return {"duration_s": round(duration, 3), "endpoints": endpoints}
+
+
+class OAuthFlows:
+    def __init__(self, client: httpx.AsyncClient, client_id: str, client_secret: str, redirect_uri: str,
+                 scope: str, password: str):
+        self.client = client
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.redirect_uri = redirect_uri
+        self.scope = scope
+        self.password = password
+
+    async def code_flow(self, recorder: Recorder, email: str) -> Optional[str]:
+        """authorize -> login -> token -> validate; возвращает refresh token"""
+        params = {"response_type": "code", "client_id": self.client_id, "redirect_uri": self.redirect_uri,
+                  "scope": self.scope, "state": "bench"}
+        if not await recorder.request(self.client, "GET /oauth/authorize", "GET", "/oauth/authorize", 200,
+                                      params=params):
+            return None
+
+        response = await recorder.request(self.client, "POST /oauth/login", "POST", "/oauth/login", 303, data={
+            "email": email, "password": self.password, "client_id": self.client_id,
+            "redirect_uri": self.redirect_uri, "scope": self.scope, "state": "bench",
+        })
+        if not response:
+            return None
+        code = parse_qs(urlparse(response.headers["location"]).query)["code"][0]
+
+        response = await recorder.request(self.client, "POST /oauth/token (authorization_code)", "POST",
+                                          "/oauth/token", 200, data={
+            "grant_type": "authorization_code", "client_id": self.client_id, "client_secret": self.client_secret,
+            "code": code, "redirect_uri": self.redirect_uri,
+        })
+        if not response:
+            return None
+        tokens = response.json()
+
+        await recorder.request(self.client, "POST /api/token/validate", "POST", "/api/token/validate", 200,
+                               data={"token": tokens["access_token"]})
+        return tokens["refresh_token"]
+
+    async def refresh_chain(self, recorder: Recorder, refresh_token: str, length: int):
+        """Последовательные обновления: каждый ответ приносит следующий refresh token"""
+        for _ in range(length):
+            response = await recorder.request(self.client, "POST /oauth/token (refresh_token)", "POST",
+                                              "/oauth/token", 200, data={
+                "grant_type": "refresh_token", "client_id": self.client_id, "client_secret": self.client_secret,
+                "refresh_token": refresh_token,
+            })
+            if not response:
+                return
+            refresh_token = response.json()["refresh_token"]
+
+    async def email_login(self, recorder: Recorder, org_email: str):
+        await recorder.request(self.client, "POST /api/auth/email-login", "POST", "/api/auth/email-login", 200,
+                               json={"email": org_email, "password": self.password})
+
+
+async def run_phase(count: int, concurrency: int, flow) -> Recorder:
+    """Выполняет count итераций flow(recorder, i) в concurrency параллельных потоках"""
+    recorder = Recorder()
+    counter = iter(range(count))
+
+    async def worker():
+        for i in counter:
+            await flow(recorder, i)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    recorder.finished = time.perf_counter()
+    return recorder
+
+
+async def seed_database(path: str, password: str):
+    """Импортирует организацию и сразу выставляет bcrypt-хэш пароля, чтобы замеры не включали
+    однократную замену устаревших SHA-256 хэшей при первом входе"""
+    from sqlalchemy import update
+    from db import async_session_factory, User
+    from import_organization import clear_database, bulk_import_organization_data
+    from config import settings
+    from passwords import password_hasher
+
+    await clear_database()
+    await bulk_import_organization_data(path, os.devnull)
+    password_hasher.start(settings.PASSWORD_HASH_ROUNDS, 1, 1)
+    try:
+        hashed = await password_hasher.hash(password)
+    finally:
+        password_hasher.stop()
+    async with async_session_factory() as session:
+        await session.execute(update(User).values(hashed_password=hashed))
+        await session.commit()
+
+
+def load_users(path: str) -> List[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        users = json.load(f)["users"]
+    if not users:
+        sys.exit(f"В {path} нет пользователей")
+    return users
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def benchmark(args) -> dict:
+    users = load_users(args.file)
+    client_config = next(iter(settings.OAUTH_CLIENTS.values()))
+    client_id = args.client_id or client_config["client_id"]
+    client_secret = args.client_secret or client_config["client_secret"]
+    redirect_uri = args.redirect_uri or client_config["redirect_uris"][0]
+
+    if args.seed:
+        await seed_database(args.file, args.password)
+
+    async def run(client: httpx.AsyncClient) -> dict:
+        flows = OAuthFlows(client, client_id, client_secret, redirect_uri, args.scope, args.password)
+
+        def user(i):
+            return users[i % len(users)]
+
+        # Прогрев: соединения пула, компиляция запросов, кэши
+        await run_phase(args.warmup, args.concurrency, lambda rec, i: flows.code_flow(rec, user(i)["email"]))
+
+        refresh_tokens: List[str] = []
+
+        async def code_flow(recorder, i):
+            token = await flows.code_flow(recorder, user(i)["email"])
+            if token:
+                refresh_tokens.append(token)
+
+        phases = {"authorization_code": await run_phase(args.flows, args.concurrency, code_flow)}
+        phases["refresh_token"] = await run_phase(
+            len(refresh_tokens), args.concurrency,
+            lambda rec, i: flows.refresh_chain(rec, refresh_tokens[i], args.refresh_chain)
+        )
+        phases["email_login"] = await run_phase(
+            args.flows, args.concurrency, lambda rec, i: flows.email_login(rec, user(i)["org_email"])
+        )
+        return {name: recorder.summary() for name, recorder in phases.items()}
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    if args.base_url:
+        async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+            phases = await run(client)
+    else:
+        from main import app
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark",
+                                         timeout=args.timeout) as client:
+                phases = await run(client)
+
+    return {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "revision": git_revision(),
+            "target": args.base_url or "in-process",
+            "python": platform.python_version(),
+            "flows": args.flows,
+            "concurrency": args.concurrency,
+            "refresh_chain": args.refresh_chain,
+            "users": len(users),
+            "password_hash_rounds": settings.PASSWORD_HASH_ROUNDS,
+        },
+        "phases": phases,
+    }
+
+
+def print_report(report: dict, baseline: Optional[dict]):
+    columns = ("requests", "errors", "rps", "p50_ms", "p95_ms", "p99_ms")
+    print(f"{'endpoint':45} " + " ".join(f"{column:>9}" for column in columns))
+    for phase_name, phase in report["phases"].items():
+        print(f"[{phase_name}] {phase['duration_s']} s")
+        for endpoint, stats in phase["endpoints"].items():
+            print(f"  {endpoint:43} " + " ".join(f"{stats[column]:>9}" for column in columns))
+            previous = (baseline or {}).get("phases", {}).get(phase_name, {}).get("endpoints", {}).get(endpoint)
+            if previous:
+                deltas = []
+                for column in columns[2:]:
+                    if previous.get(column):
+                        deltas.append(f"{(stats[column] - previous[column]) / previous[column] * 100:>+8.1f}%")
+                    else:
+                        deltas.append(f"{'-':>9}")
+                print(f"  {'vs baseline':43} {'':>9} {'':>9} " + " ".join(deltas))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест OAuth потоков")
+    parser.add_argument("--base-url", help="Адрес запущенного сервера; без него приложение запускается в процессе")
+    parser.add_argument("--seed", action="store_true", help="Очистить таблицы и импортировать --file")
+    parser.add_argument("--file", default="organization_data.json", help="Файл организации из organization_seed.py")
+    parser.add_argument("--password", default="test", help="Пароль пользователей из файла")
+    parser.add_argument("--client-id")
+    parser.add_argument("--client-secret")
+    parser.add_argument("--redirect-uri")
+    parser.add_argument("--scope", default="profile documents")
+    parser.add_argument("--flows", type=int, default=200, help="Число полных code flow и входов по email")
+    parser.add_argument("--refresh-chain", type=int, default=3, help="Обновлений подряд на каждый refresh token")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=20, help="Code flow до начала замеров")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="Сохранить отчет в JSON")
+    parser.add_argument("--compare", help="Отчет предыдущего запуска для сравнения")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    report = asyncio.run(benchmark(args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    failed = sum(stats["errors"] for phase in report["phases"].values() for stats in phase["endpoints"].values())
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# check_import_time.py
+"""Бюджет времени холодного импорта приложения.
+
+Запускает `python -X importtime -c "import main"` в отдельных процессах, печатает самые
+дорогие модули и завершается с кодом 1, если импорт дольше бюджета или если при импорте
+создается то, что должно создаваться только в lifespan (настройки, журнал, движок БД, драйвер,
+ключи подписи, шаблоны, статика). Переменные окружения для импорта не нужны, поэтому проверка
+выполняется и при сборке образа (см. Dockerfile).
+"""
+import argparse
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple
+
+# Выполняется в дочернем процессе после импорта: ничего из этого не должно быть создано заранее
+LAZY_CHECK = """
+import sys, config, db, logging_setup, main, oauth2
+problems = []
+if config.get_settings.cache_info().currsize:
+    problems.append("настройки прочитаны при импорте")
+if logging_setup._listener is not None:
+    problems.append("поток журнала запущен при импорте")
+if oauth2.get_key_ring.cache_info().currsize:
+    problems.append("ключи подписи JWT загружены при импорте")
+if db._engine is not None:
+    problems.append("движок БД создан при импорте")
+if "psycopg" in sys.modules:
+    problems.append("драйвер psycopg загружен при импорте")
+if main.get_templates.cache_info().currsize:
+    problems.append("Jinja2Templates создан при импорте")
+if main.login_page._page is not None:
+    problems.append("шаблон страницы входа скомпилирован при импорте")
+if any(getattr(route, "name", None) == "static" for route in main.app.routes):
+    problems.append("статика смонтирована при импорте")
+if main.app.middleware_stack is not None:
+    problems.append("стек middleware собран при импорте")
+print("\\n".join(problems))
+"""
+
+
+class ImportRecord(NamedTuple):
+    name: str
+    depth: int
+    self_us: int
+    cumulative_us: int
+
+
+def parse_importtime(output: str) -> List[ImportRecord]:
+    records = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        records.append(ImportRecord(name.strip(), depth, int(self_us), int(cumulative_us)))
+    return records
+
+
+def profile_import(module: str) -> List[ImportRecord]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-W", "ignore", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        sys.exit(f"Импорт {module} завершился с ошибкой:\n{result.stderr}")
+    return parse_importtime(result.stderr)
+
+
+def print_report(records: List[ImportRecord], module: str, top: int):
+    total = next(record for record in records if record.name == module)
+    print(f"import {module}: {total.cumulative_us / 1000:.1f} ms")
+
+    # Пакеты верхнего уровня: куда уходит время по зависимостям
+    packages: Dict[str, int] = {}
+    for record in records:
+        if record.depth == 1:
+            root = record.name.split(".")[0]
+            packages[root] = packages.get(root, 0) + record.cumulative_us
+    print(f"\nПрямые зависимости {module} (cumulative):")
+    for name, cumulative_us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    print("\nСобственное время модулей (self):")
+    for record in sorted(records, key=lambda item: -item.self_us)[:top]:
+        print(f"  {record.self_us / 1000:8.1f} ms  {record.name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка времени холодного импорта приложения")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=1100.0, help="Допустимое время импорта модуля")
+    parser.add_argument("--runs", type=int, default=3, help="Число запусков; берется самый быстрый")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [profile_import(args.module) for _ in range(args.runs)]
+    best = min(runs, key=lambda records: next(r.cumulative_us for r in records if r.name == args.module))
+    print_report(best, args.module, args.top)
+
+    failed = False
+    elapsed_ms = next(r.cumulative_us for r in best if r.name == args.module) / 1000
+    if elapsed_ms > args.budget_ms:
+        print(f"\nFAIL: импорт {args.module} занимает {elapsed_ms:.1f} ms при бюджете {args.budget_ms:.0f} ms")
+        failed = True
+
+    if args.module == "main":
+        lazy = subprocess.run([sys.executable, "-W", "ignore", "-c", LAZY_CHECK], capture_output=True, text=True)
+        problems = [line for line in lazy.stdout.splitlines() if line] if lazy.returncode == 0 \
+            else [lazy.stderr.strip()]
+        for problem in problems:
+            print(f"FAIL: {problem}")
+            failed = True
+
+    if not failed:
+        print(f"\nOK: {elapsed_ms:.1f} ms при бюджете {args.budget_ms:.0f} ms")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
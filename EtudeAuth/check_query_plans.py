@@ -0,0 +1,166 @@
+# check_query_plans.py
+"""Проверка планов запросов документооборота и ротации refresh токенов.
+
+Заполняет базу синтетическими данными в транзакции, собирает статистику и через EXPLAIN
+проверяет, что каждый запрос использует предназначенный для него индекс. Транзакция
+откатывается, данные и статистика в базе не остаются. Код возврата 1, если план изменился.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from datetime import timedelta
+
+from psycopg.types.json import Jsonb
+from sqlalchemy import select, exists, func, not_
+
+from db import engine, Document, User
+from pagination import keyset_page
+from refresh_tokens import consume_refresh_token_statement, hash_refresh_token
+
+SEED_SQL = """
+INSERT INTO companies (id, name)
+SELECT gen_random_uuid(), 'plan-check-company-' || i FROM generate_series(1, %(companies)s) AS i;
+
+INSERT INTO departments (id, name, company_id)
+SELECT gen_random_uuid(), 'plan-check-department-' || i,
+       (ARRAY(SELECT id FROM companies WHERE name LIKE 'plan-check-%%'))[1 + i %% %(companies)s]
+FROM generate_series(1, %(departments)s) AS i;
+
+INSERT INTO users (id, email, org_email, name, surname, position, department_id, is_leader)
+SELECT gen_random_uuid(), 'plan-check-' || i || '@example.com', 'plan-check-' || i || '@org.example.com',
+       'Name', 'Surname', 'Position',
+       (ARRAY(SELECT id FROM departments WHERE name LIKE 'plan-check-%%'))[1 + i %% %(departments)s], false
+FROM generate_series(1, %(users)s) AS i;
+
+INSERT INTO documents ("EtudeDocID", coordinating, "isApproval", "DocInfo", created_at, owner_id)
+SELECT 'plan-check-' || i, jsonb_build_object('plan-check-approver-' || i %% %(approvers)s, 'approver'),
+       random() > %(pending_share)s, jsonb_build_object('type', 'plan-check-type-' || i %% %(types)s),
+       now() - (%(documents)s - i) * interval '30 days' / %(documents)s,
+       (ARRAY(SELECT id FROM users WHERE email LIKE 'plan-check-%%'))[1 + i %% %(users)s]
+FROM generate_series(1, %(documents)s) AS i;
+
+INSERT INTO oauth_clients (client_id, client_secret, redirect_uris, allowed_scopes)
+VALUES ('plan-check-client', 'plan-check-secret', 'http://localhost', 'profile');
+
+INSERT INTO refresh_tokens (token_hash, email, scopes, client_id, expires_at, created_at, revoked)
+SELECT sha256(('plan-check-' || i)::bytea), 'plan-check-' || i || '@example.com', 'profile', 'plan-check-client',
+       now() + interval '30 days', now(), random() < %(revoked_share)s
+FROM generate_series(1, %(refresh_tokens)s) AS i;
+
+ANALYZE companies, departments, users, documents, refresh_tokens;
+"""
+
+
+def expected_plans(owner_id, department_id):
+    """Запросы в том виде, в каком их строят обработчики, и индексы, которые они должны использовать"""
+    return [
+        ("pending documents page",
+         keyset_page(select(Document).where(not_(Document.isApproval)), Document.id, None, 100),
+         "ix_documents_pending_id"),
+        ("overdue documents batch",
+         select(Document.id)
+         .where(not_(Document.isApproval) & (Document.created_at < func.now() - timedelta(days=29)))
+         .order_by(Document.created_at).limit(500).with_for_update(skip_locked=True),
+         "ix_documents_pending_created_at"),
+        ("user has documents",
+         select(exists().where(Document.owner_id == owner_id)),
+         "ix_documents_owner_id_id"),
+        ("owner documents page",
+         keyset_page(select(Document).where(Document.owner_id == owner_id), Document.id, None, 100),
+         "ix_documents_owner_id_id"),
+        ("approver documents page",
+         keyset_page(select(Document).where(Document.coordinating.has_key("plan-check-approver-1")),
+                     Document.id, None, 100),
+         "ix_documents_coordinating"),
+        ("documents by DocInfo field",
+         keyset_page(select(Document).where(Document.DocInfo.contains({"type": "plan-check-type-1"})),
+                     Document.id, None, 100),
+         "ix_documents_docinfo"),
+        ("department users page",
+         keyset_page(select(User).where(User.department_id == department_id), User.id, None, 100),
+         "ix_users_department_id_id"),
+        ("refresh token rotation",
+         consume_refresh_token_statement(hash_refresh_token("plan-check-1"), "plan-check-client"),
+         "ix_refresh_tokens_active_token_hash"),
+    ]
+
+
+def used_indexes(plan: dict) -> set:
+    """Имена всех индексов в дереве плана"""
+    names = {plan["Index Name"]} if "Index Name" in plan else set()
+    for child in plan.get("Plans", []):
+        names |= used_indexes(child)
+    return names
+
+
+async def explain(conn, query) -> dict:
+    compiled = query.compile(dialect=conn.dialect)
+    # Параметры передаются драйверу напрямую, минуя преобразования типов SQLAlchemy
+    params = {name: Jsonb(value) if isinstance(value, dict) else value for name, value in compiled.params.items()}
+    result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", params)
+    plan = result.scalar()
+    return (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+
+
+async def check_plans(args) -> bool:
+    params = {
+        "companies": args.companies,
+        "departments": args.departments,
+        "users": args.users,
+        "documents": args.documents,
+        "pending_share": args.pending_share,
+        "approvers": args.approvers,
+        "types": args.types,
+        "refresh_tokens": args.refresh_tokens,
+        "revoked_share": args.revoked_share,
+    }
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        try:
+            for statement in SEED_SQL.split(";"):
+                if statement.strip():
+                    await conn.exec_driver_sql(statement, params)
+
+            owner_id, department_id = (await conn.execute(
+                select(User.id, User.department_id).where(User.email.like("plan-check-%")).limit(1)
+            )).one()
+
+            ok = True
+            for name, query, index in expected_plans(owner_id, department_id):
+                plan = await explain(conn, query)
+                indexes = used_indexes(plan)
+                passed = index in indexes
+                ok &= passed
+                print(f"{'OK  ' if passed else 'FAIL'} {name}: ожидается {index}, "
+                      f"план {plan['Node Type']} {sorted(indexes) or ''}")
+                if not passed and args.verbose:
+                    print(json.dumps(plan, indent=2, ensure_ascii=False))
+            return ok
+        finally:
+            await transaction.rollback()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Проверка использования индексов запросами документооборота")
+    parser.add_argument("--companies", type=int, default=5)
+    parser.add_argument("--departments", type=int, default=200)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--documents", type=int, default=200000)
+    parser.add_argument("--pending-share", type=float, default=0.02, help="Доля несогласованных документов")
+    parser.add_argument("--approvers", type=int, default=5000, help="Число разных согласующих")
+    parser.add_argument("--types", type=int, default=2000, help="Число разных значений DocInfo.type")
+    parser.add_argument("--refresh-tokens", type=int, default=100000)
+    parser.add_argument("--revoked-share", type=float, default=0.1, help="Доля отозванных refresh токенов")
+    parser.add_argument("--verbose", action="store_true", help="Печатать план запроса при ошибке")
+    args = parser.parse_args()
+
+    try:
+        ok = await check_plans(args)
+    finally:
+        await engine.dispose()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
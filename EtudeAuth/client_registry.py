@@ -0,0 +1,153 @@
+import asyncio
+import hmac
+import logging
+import re
+from types import MappingProxyType
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import select, func, or_
+from sqlalchemy.dialects.postgresql import insert
+
+from config import settings
+from db import async_session_factory, OAuthClient
+from notifications import notification_listener
+
+logger = logging.getLogger(__name__)
+
+# Канал, в который триггер на oauth_clients отправляет уведомление об изменении
+CLIENTS_CHANNEL = "oauth_clients_changed"
+
+
+def split_list(value: Optional[str]) -> frozenset:
+    """Разбирает строку значений из oauth_clients: через запятую или пробел (старые записи)"""
+    return frozenset(item for item in re.split(r"[\s,]+", value or "") if item)
+
+
+class RegisteredClient(NamedTuple):
+    """Неизменяемая запись клиента с заранее разобранными redirect URI и scopes"""
+    client_id: str
+    client_secret: str
+    name: Optional[str]
+    redirect_uris: frozenset
+    allowed_scopes: frozenset
+
+    @property
+    def display_name(self) -> str:
+        return self.name or self.client_id
+
+    def check_secret(self, client_secret: Optional[str]) -> bool:
+        return hmac.compare_digest((client_secret or "").encode(), (self.client_secret or "").encode())
+
+
+class ClientRegistry:
+    """Реестр OAuth клиентов из таблицы oauth_clients.
+
+    Клиенты загружаются в неизменяемый снимок, который целиком заменяется при обновлении,
+    поэтому проверки клиента на пути выдачи токенов не обращаются к БД.
+    Снимок обновляется по NOTIFY от триггера на таблице и дополнительно по интервалу
+    (уведомления недоступны, например, через PgBouncer в transaction-режиме).
+    """
+
+    def __init__(self):
+        self._clients = MappingProxyType({})
+        self._order: List[str] = []
+        self._tasks: List[asyncio.Task] = []
+
+    def get(self, client_id: Optional[str]) -> Optional[RegisteredClient]:
+        return self._clients.get(client_id)
+
+    def authenticate(self, client_id: str, client_secret: str) -> Optional[RegisteredClient]:
+        client = self._clients.get(client_id)
+        if client is None or not client.check_secret(client_secret):
+            return None
+        return client
+
+    def first(self) -> Optional[RegisteredClient]:
+        """Клиент, зарегистрированный первым"""
+        return self._clients[self._order[0]] if self._order else None
+
+    def display_name(self, client_id: str) -> str:
+        client = self._clients.get(client_id)
+        return client.display_name if client else client_id
+
+    async def seed(self, clients: Dict[str, dict]):
+        """Записывает клиентов из настроек в таблицу.
+
+        Для клиентов из настроек источником истины остаются настройки: существующие строки
+        (например, из dump.sql или записанные в старом формате) приводятся к ним.
+        Название, заданное в таблице, сохраняется, если в настройках его нет.
+        """
+        if not clients:
+            return
+        rows = [
+            {
+                "client_id": client_id,
+                "client_secret": client["client_secret"],
+                "name": client.get("name"),
+                "redirect_uris": ",".join(client["redirect_uris"]),
+                "allowed_scopes": ",".join(client["allowed_scopes"]),
+            }
+            for client_id, client in clients.items()
+        ]
+        stmt = insert(OAuthClient).values(rows)
+        excluded = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["client_id"],
+            set_={
+                "client_secret": excluded.client_secret,
+                "name": func.coalesce(excluded.name, OAuthClient.name),
+                "redirect_uris": excluded.redirect_uris,
+                "allowed_scopes": excluded.allowed_scopes,
+                "updated_at": func.now(),
+            },
+            # Совпадающие строки не перезаписываются
+            where=or_(
+                OAuthClient.client_secret.is_distinct_from(excluded.client_secret),
+                OAuthClient.redirect_uris.is_distinct_from(excluded.redirect_uris),
+                OAuthClient.allowed_scopes.is_distinct_from(excluded.allowed_scopes),
+                excluded.name.is_not(None) & OAuthClient.name.is_distinct_from(excluded.name),
+            )
+        )
+        async with async_session_factory() as session:
+            await session.execute(stmt)
+            await session.commit()
+
+    async def refresh(self):
+        async with async_session_factory() as session:
+            rows = (await session.execute(select(OAuthClient).order_by(OAuthClient.id))).scalars().all()
+
+        clients = {
+            row.client_id: RegisteredClient(
+                client_id=row.client_id,
+                client_secret=row.client_secret,
+                name=row.name,
+                redirect_uris=split_list(row.redirect_uris),
+                allowed_scopes=split_list(row.allowed_scopes),
+            )
+            for row in rows
+        }
+        self._clients, self._order = MappingProxyType(clients), list(clients)
+
+    async def _refresh_periodically(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("OAuth clients refresh failed")
+
+    async def start(self, refresh_interval: float, listen: bool):
+        await self.seed(settings.OAUTH_CLIENTS)
+        await self.refresh()
+        self._tasks.append(asyncio.create_task(self._refresh_periodically(refresh_interval)))
+        if listen:
+            # Уведомления от триггера на oauth_clients; слушатель запускается в lifespan
+            notification_listener.subscribe(CLIENTS_CHANNEL, self.refresh)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+
+client_registry = ClientRegistry()
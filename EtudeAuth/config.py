@@ -1,4 +1,6 @@
-from typing import List
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -10,6 +12,15 @@ class Settings(BaseSettings):
     DB_USER: str
     DB_PASS: str
 
+    # Пул соединений (на каждый воркер): всего до (DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW) * число воркеров
+    DB_POOL_SIZE: int = 5  # Постоянных соединений в пуле
+    DB_POOL_MAX_OVERFLOW: int = 10  # Дополнительных соединений сверх пула при пиковой нагрузке
+    DB_POOL_TIMEOUT: float = 30.0  # Сколько ждать свободного соединения (в секундах)
+    DB_POOL_RECYCLE: int = 1800  # Пересоздавать соединения старше (в секундах, -1 - никогда)
+    DB_POOL_PRE_PING: bool = False  # Проверять соединение перед выдачей из пула
+    # Работа через PgBouncer (transaction-режим): без локального пула и подготовленных выражений
+    DB_PGBOUNCER: bool = False
+
     # Секретные ключи
     SECRET: str  # Для подписи JWT-токенов
     VERIFY_TOKEN_SECRET: str  # Для проверки токенов
@@ -18,10 +29,76 @@ class Settings(BaseSettings):
     JWT_ACCESS_TTL: int = 3600  # Время жизни access токена (в секундах)
     JWT_REFRESH_TTL: int = 2592000  # Время жизни refresh токена (30 дней)
 
+    # Асимметричная подпись JWT (RS256/ES256): каталог с PEM-ключами, имя файла - kid.
+    # Если каталог не задан, токены подписываются HS256 общим секретом SECRET
+    JWT_KEYS_DIR: Optional[str] = None
+    JWT_ACTIVE_KID: Optional[str] = None  # По умолчанию - последний по имени ключ
+    # До какого момента (UTC) после перехода на ключи принимать токены без kid, подписанные SECRET.
+    # Достаточно времени выдачи последнего HS256 токена плюс JWT_ACCESS_TTL; None - не принимать
+    JWT_HS256_ACCEPT_UNTIL: Optional[datetime] = None
+
+    # Хранилище отозванных токенов: "database" (общая таблица) или "memory" (локально для процесса)
+    REVOCATION_BACKEND: str = "database"
+    REVOCATION_REFRESH_INTERVAL: float = 5.0  # Период инкрементальной синхронизации (в секундах)
+    REVOCATION_REBUILD_INTERVAL: float = 600.0  # Период полной пересборки фильтра (в секундах)
+    REVOCATION_BLOOM_CAPACITY: int = 100000  # Ожидаемое число одновременно отозванных токенов
+    REVOCATION_BLOOM_ERROR_RATE: float = 0.001  # Допустимая доля ложноположительных ответов
+    # Сколько последних id перечитывать при синхронизации: отзыв с меньшим id мог быть зафиксирован позже
+    REVOCATION_SYNC_OVERLAP: int = 1000
+
+    # Размер LRU-кэша проверенных access токенов (0 - кэш отключен)
+    TOKEN_CACHE_SIZE: int = 10000
+
+    # Кэш пользователей для проверки токенов: время жизни записи (в секундах) и размер
+    USER_CACHE_TTL: float = 30.0
+    USER_CACHE_SIZE: int = 10000
+
+    # Время жизни кэша структуры организации (в секундах); ограничивает устаревание на других воркерах,
+    # если уведомления об изменениях недоступны (PgBouncer в transaction-режиме)
+    ORG_STRUCTURE_CACHE_TTL: float = 60.0
+
+    # Автоматическое согласование документов
+    AUTO_APPROVAL_TIME: int = 300  # Через сколько секунд после создания документ согласуется
+    AUTO_APPROVAL_POLL_INTERVAL: float = 15.0  # Период опроса просроченных документов (в секундах)
+    AUTO_APPROVAL_BATCH_SIZE: int = 1000  # Документов в одном UPDATE
+
+    # Период удаления истекших кодов авторизации (в секундах)
+    AUTH_CODE_PURGE_INTERVAL: float = 300.0
+
+    # Удаление истекших и отозванных refresh токенов
+    REFRESH_TOKEN_GC_INTERVAL: float = 600.0  # Период очистки (в секундах)
+    REFRESH_TOKEN_GC_BATCH_SIZE: int = 1000  # Строк в одном DELETE
+
+    # Хэширование паролей bcrypt
+    PASSWORD_HASH_ROUNDS: int = 12  # Стоимость bcrypt (каждая единица удваивает время)
+    PASSWORD_HASH_WORKERS: int = 4  # Потоков в пуле хэширования
+    PASSWORD_HASH_CONCURRENCY: int = 4  # Одновременных хэширований на воркер
+
+    # Структурированные JSON-логи
+    LOG_LEVEL: str = "INFO"
+    LOG_QUEUE_SIZE: int = 10000  # Записей в очереди до потока записи; при переполнении записи отбрасываются
+    LOG_ACCESS_SAMPLE_RATE: float = 1.0  # Доля запросов в журнале запросов по умолчанию
+    # Доля для частых маршрутов (по шаблону пути)
+    LOG_ROUTE_SAMPLE_RATES: Dict[str, float] = {
+        "/api/token/validate": 0.01,
+        "/api/token/validate/batch": 0.01,
+        "/.well-known/jwks.json": 0.01,
+        "/metrics": 0.0,
+    }
+
+    # Метрики Prometheus: общий каталог, куда воркеры gunicorn пишут снимки своих метрик
+    # для суммирования на /metrics (без каталога отдаются метрики одного воркера)
+    METRICS_DIR: Optional[str] = None
+    METRICS_DUMP_INTERVAL: float = 5.0  # Период записи снимка (в секундах)
+
     # Разрешенные домены для CORS
     ORIGINS: List[str] = ['*']
 
-    # Зарегистрированные клиенты OAuth (в продакшене должны храниться в БД)
+    # Реестр OAuth клиентов (таблица oauth_clients)
+    OAUTH_CLIENTS_REFRESH_INTERVAL: float = 30.0  # Период перечитывания таблицы (в секундах)
+    OAUTH_CLIENTS_LISTEN: bool = True  # Обновлять реестр по NOTIFY (отключить для PgBouncer в transaction-режиме)
+
+    # Клиенты OAuth из настроек: при старте записываются в oauth_clients или обновляют существующие строки
     OAUTH_CLIENTS: dict = {
         "etude_backend_client": {
             "client_id": "etude_backend_client",
@@ -33,5 +110,26 @@ class Settings(BaseSettings):
 
     model_config = SettingsConfigDict(env_file=".env")
 
+    @property
+    def DATABASE_URL(self) -> str:
+        # Один и тот же URL подходит и для async движка приложения, и для синхронного движка Alembic
+        return f"postgresql+psycopg://{self.DB_USER}:{self.DB_PASS}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+
+
+@lru_cache
+def get_settings() -> Settings:
+    return Settings()
+
+
+class LazySettings:
+    """Настройки читаются из окружения и .env при первом обращении, а не при импорте config.
+
+    Объекты уровня модуля (кэши, пулы, middleware) при импорте настройки не читают:
+    их настраивает lifespan или сборка стека middleware при первом вызове приложения.
+    """
+
+    def __getattr__(self, name):
+        return getattr(get_settings(), name)
+
 
-settings = Settings()
\ No newline at end of file
+settings = LazySettings()
\ No newline at end of file
@@ -1,25 +1,149 @@
+import time
 import uuid
-from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Text, ARRAY, JSON, Integer
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Text, ARRAY, Integer, Index, LargeBinary, \
+    text, event
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.sql import func
 from datetime import datetime, timedelta
 
 from config import settings
+from metrics import instrument_engine, DB_POOL_CHECKOUT_WAIT
 
 Base = declarative_base()
 
-# Создаем асинхронное подключение к PostgreSQL
-engine = create_async_engine(
-    f"postgresql+psycopg://{settings.DB_USER}:{settings.DB_PASS}@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}",
-    echo=False
-)
+
+class PoolMetrics:
+    """Метрики пула соединений воркера: ожидание выдачи соединения и занятые соединения"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.in_use = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def observe_wait(self, seconds: float):
+        DB_POOL_CHECKOUT_WAIT.observe(seconds)
+        self.checkouts += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+
+    def stats(self, pool) -> dict:
+        return {
+            "pool_class": type(pool).__name__,
+            "size": pool.size() if hasattr(pool, "size") else 0,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") else 0,
+            "in_use": self.in_use,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_avg": self.wait_total / self.checkouts if self.checkouts else 0.0,
+            "wait_max": self.wait_max,
+        }
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedCheckoutMixin:
+    """Замеряет время получения соединения из пула, включая ожидание свободного и подключение"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        finally:
+            pool_metrics.observe_wait(time.perf_counter() - started)
+
+
+class InstrumentedQueuePool(TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+class InstrumentedNullPool(TimedCheckoutMixin, NullPool):
+    pass
+
+
+def create_engine_from_settings():
+    """Создает движок по настройкам пула; в режиме PgBouncer пулом управляет PgBouncer"""
+    url = settings.DATABASE_URL
+
+    if settings.DB_PGBOUNCER:
+        # В transaction-режиме PgBouncer подготовленные выражения не переживают смену соединения
+        new_engine = create_async_engine(
+            url,
+            echo=False,
+            # Значения параметров (коды, хэши токенов и паролей) не попадают в текст исключений
+            hide_parameters=True,
+            poolclass=InstrumentedNullPool,
+            connect_args={"prepare_threshold": None}
+        )
+    else:
+        new_engine = create_async_engine(
+            url,
+            echo=False,
+            hide_parameters=True,
+            poolclass=InstrumentedQueuePool,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_POOL_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=settings.DB_POOL_PRE_PING
+        )
+
+    @event.listens_for(new_engine.sync_engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_metrics.in_use += 1
+
+    @event.listens_for(new_engine.sync_engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        pool_metrics.in_use -= 1
+
+    instrument_engine(new_engine)
+    return new_engine
+
+
+_engine = None
+
+
+def get_engine():
+    """Асинхронный движок PostgreSQL; создается при первом обращении, а не при импорте db"""
+    global _engine
+    if _engine is None:
+        _engine = create_engine_from_settings()
+        async_session_factory.configure(bind=_engine)
+    return _engine
+
+
+async def dispose_engine():
+    if _engine is not None:
+        await _engine.dispose()
+
+
+def __getattr__(name):
+    # Совместимость с `from db import engine` в скриптах
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class LazySessionMaker(sessionmaker):
+    """Фабрика сессий, которая создает движок при открытии первой сессии"""
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            get_engine()
+        return super().__call__(**local_kw)
+
 
 # Создаем асинхронную фабрику сессий
-async_session_factory = sessionmaker(
-    engine, class_=AsyncSession, expire_on_commit=False
-)
+async_session_factory = LazySessionMaker(class_=AsyncSession, expire_on_commit=False)
 
 # Функция для получения асинхронной сессии
 async def get_async_session():
@@ -48,6 +172,11 @@ class User(Base):
     tokens = relationship("RefreshToken", back_populates="user")
     documents = relationship("Document", back_populates="owner")
 
+    __table_args__ = (
+        # Сотрудники департамента по порядку id (фильтр списка пользователей, структура организации)
+        Index("ix_users_department_id_id", "department_id", "id"),
+    )
+
 
 # Модель для OAuth клиентов
 class OAuthClient(Base):
@@ -87,12 +216,12 @@ class RefreshToken(Base):
     __tablename__ = "refresh_tokens"
 
     id = Column(Integer, primary_key=True, index=True)
-    token = Column(String, unique=True, index=True)
+    token_hash = Column(LargeBinary(32), nullable=False)  # SHA-256 от токена, сам токен не хранится
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
     email = Column(String)
     scopes = Column(String)  # Разделенные запятой scopes
     client_id = Column(String, ForeignKey("oauth_clients.client_id"))
-    expires_at = Column(DateTime)
+    expires_at = Column(DateTime, index=True)
     created_at = Column(DateTime, default=func.now())
     revoked = Column(Boolean, default=False)
 
@@ -100,6 +229,11 @@ class RefreshToken(Base):
     user = relationship("User", back_populates="tokens")
     client = relationship("OAuthClient")
 
+    __table_args__ = (
+        # Поиск идет только среди действующих токенов, отозванные не занимают место в индексе
+        Index("ix_refresh_tokens_active_token_hash", "token_hash", unique=True, postgresql_where=text("NOT revoked")),
+    )
+
 
 # Модель для документов
 class Document(Base):
@@ -107,20 +241,44 @@ class Document(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     EtudeDocID = Column(String, unique=True, index=True)  # UUID из EtudeBackend
-    coordinating = Column(JSON)  # Словарь с ID пользователей для согласования {EtudeAuthID: EtudeBackendID}
+    coordinating = Column(JSONB)  # Словарь с ID пользователей для согласования {EtudeAuthID: EtudeBackendID}
     isApproval = Column(Boolean, default=False)  # Статус согласования
-    DocInfo = Column(JSON)  # Вся информация о документе в JSON
+    DocInfo = Column(JSONB)  # Вся информация о документе в JSON
     created_at = Column(DateTime, default=func.now())  # Дата и время создания документа
     owner_id = Column(UUID(as_uuid=True), ForeignKey("users.id"))
 
     # Отношения
     owner = relationship("User", back_populates="documents")
 
+    __table_args__ = (
+        # Очередь автоматического согласования: только несогласованные документы по времени создания
+        Index("ix_documents_pending_created_at", "created_at", postgresql_where=text('NOT "isApproval"')),
+        # Постраничный список документов, ожидающих согласования
+        Index("ix_documents_pending_id", "id", postgresql_where=text('NOT "isApproval"')),
+        # Документы владельца по порядку id; также проверка наличия документов при удалении пользователя
+        Index("ix_documents_owner_id_id", "owner_id", "id"),
+        # Входящие согласующего: проверка наличия ключа (?) поддерживается только классом jsonb_ops
+        Index("ix_documents_coordinating", "coordinating", postgresql_using="gin"),
+        # Поиск по полям DocInfo только через @>, поэтому более компактный jsonb_path_ops
+        Index("ix_documents_docinfo", "DocInfo", postgresql_using="gin", postgresql_ops={"DocInfo": "jsonb_path_ops"}),
+    )
+
+
+# Модель отозванных токенов (общая для всех воркеров)
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    id = Column(Integer, primary_key=True)  # Монотонный курсор для инкрементальной синхронизации
+    jti = Column(String, unique=True, index=True, nullable=False)
+    expires_at = Column(DateTime, index=True, nullable=False)  # После истечения запись можно удалить
+    revoked_at = Column(DateTime, default=func.now())
+
+
 class AuthToken(Base):
     __tablename__ = "auth_tokens"
 
     id = Column(Integer, primary_key=True, index=True)
-    code = Column(String)
+    code = Column(String, unique=True, index=True)
     email = Column(String)
     scopes = Column(ARRAY(String))
     client_id = Column(String)
@@ -153,7 +311,7 @@ class Department(Base):
 
 # Функция для инициализации базы данных
 async def init_db():
-    async with engine.begin() as conn:
+    async with get_engine().begin() as conn:
         # Создаем таблицы, если их нет
         await conn.run_sync(Base.metadata.create_all)
 
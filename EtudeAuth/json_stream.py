@@ -0,0 +1,87 @@
+import json
+
+CHUNK_SIZE = 1 << 16
+NUMBER_DELIMITERS = ",]} \t\r\n"
+
+
+class JsonStreamReader:
+    """Потоковое чтение JSON-файла: значения разбираются по одному, не загружая файл целиком"""
+
+    def __init__(self, f, chunk_size: int = CHUNK_SIZE):
+        self._file = f
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _read_more(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        # Отбрасываем уже разобранную часть буфера
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos].isspace():
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read_more():
+                raise ValueError("Unexpected end of JSON input")
+
+    def _expect(self, char: str):
+        if self._peek() != char:
+            raise ValueError(f"Expected '{char}' at position {self._pos}")
+        self._pos += 1
+
+    def _skip_comma(self):
+        if self._peek() == ",":
+            self._pos += 1
+
+    def read_value(self):
+        """Разбирает следующее значение; дочитывает файл, пока значение не окажется в буфере целиком"""
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+                # Число на границе буфера может продолжаться в следующем блоке
+                complete = end < len(self._buffer) and (
+                    not isinstance(value, (int, float)) or self._buffer[end] in NUMBER_DELIMITERS
+                )
+                if complete or not self._read_more():
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if not self._read_more():
+                    raise
+
+    def iter_array(self):
+        """Перебирает элементы массива, начинающегося в текущей позиции"""
+        self._expect("[")
+        while self._peek() != "]":
+            yield self.read_value()
+            self._skip_comma()
+        self._pos += 1
+
+    def iter_object(self, streamed_keys=()):
+        """Перебирает пары объекта; значения ключей из streamed_keys отдаются итератором элементов массива.
+
+        Итератор нужно исчерпать до перехода к следующей паре.
+        """
+        self._expect("{")
+        while self._peek() != "}":
+            key = self.read_value()
+            self._expect(":")
+            if key in streamed_keys:
+                yield key, self.iter_array()
+            else:
+                yield key, self.read_value()
+            self._skip_comma()
+        self._pos += 1
@@ -0,0 +1,93 @@
+import json
+import os
+import sys
+from datetime import datetime
+from typing import Dict, Optional
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from jwt.algorithms import ECAlgorithm, RSAAlgorithm
+
+
+class SigningKey:
+    """Разобранный ключ подписи: идентификатор, алгоритм и объекты ключей"""
+
+    def __init__(self, kid: str, private_key):
+        self.kid = kid
+        self.private_key = private_key
+        self.public_key = private_key.public_key()
+
+        if isinstance(private_key, rsa.RSAPrivateKey):
+            self.algorithm = "RS256"
+            self.jwk = RSAAlgorithm.to_jwk(self.public_key, as_dict=True)
+        elif isinstance(private_key, ec.EllipticCurvePrivateKey) and isinstance(private_key.curve, ec.SECP256R1):
+            self.algorithm = "ES256"
+            self.jwk = ECAlgorithm.to_jwk(self.public_key, as_dict=True)
+        else:
+            raise ValueError(f"Unsupported key type for kid {kid}: only RSA and EC P-256 keys are allowed")
+
+        self.jwk.update({"kid": kid, "alg": self.algorithm, "use": "sig"})
+
+
+class KeyRing:
+    """Набор ключей подписи JWT, загружаемый один раз при старте воркера.
+
+    Каждый PEM-файл в каталоге - отдельный ключ, имя файла без расширения - его kid.
+    Новые токены подписываются активным ключом, проверка принимает любой ключ из набора,
+    поэтому при ротации старый ключ оставляют в каталоге до истечения выданных им токенов.
+    """
+
+    def __init__(self, keys: Dict[str, SigningKey], active_kid: str):
+        if active_kid not in keys:
+            raise ValueError(f"Active signing key {active_kid} not found")
+        self.keys = keys
+        self.active = keys[active_kid]
+        # JWKS сериализуется один раз - ответ эндпоинта не меняется до перезапуска
+        self.jwks = {"keys": [key.jwk for key in keys.values()]}
+        self.jwks_json = json.dumps(self.jwks).encode()
+
+    @classmethod
+    def load(cls, directory: str, active_kid: Optional[str] = None):
+        keys = {}
+        for file_name in sorted(os.listdir(directory)):
+            if not file_name.endswith(".pem"):
+                continue
+            kid = file_name[:-len(".pem")]
+            with open(os.path.join(directory, file_name), "rb") as f:
+                private_key = serialization.load_pem_private_key(f.read(), password=None)
+            keys[kid] = SigningKey(kid, private_key)
+
+        if not keys:
+            raise ValueError(f"No signing keys found in {directory}")
+
+        # По умолчанию активен последний по имени ключ (имена генерируются по времени создания)
+        return cls(keys, active_kid or max(keys))
+
+    def get(self, kid: Optional[str]) -> Optional[SigningKey]:
+        return self.keys.get(kid) if kid else None
+
+
+def generate_key(directory: str, key_type: str = "rsa") -> str:
+    """Создает новый ключ подписи в каталоге и возвращает путь к нему"""
+    if key_type == "ec":
+        private_key = ec.generate_private_key(ec.SECP256R1())
+    else:
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    os.makedirs(directory, exist_ok=True)
+    kid = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    path = os.path.join(directory, f"{kid}.pem")
+    with open(path, "wb") as f:
+        f.write(private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption()
+        ))
+    return path
+
+
+# Генерация нового ключа для ротации: python keys.py [rsa|ec] [каталог]
+if __name__ == "__main__":
+    key_type = sys.argv[1] if len(sys.argv) > 1 else "rsa"
+    directory = sys.argv[2] if len(sys.argv) > 2 else "keys"
+    print(f"Ключ создан: {generate_key(directory, key_type)}")
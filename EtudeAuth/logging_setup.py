@@ -0,0 +1,187 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from config import settings
+
+REDACTED = "***"
+
+# Поля, значения которых никогда не попадают в лог
+SENSITIVE_FIELDS = frozenset({
+    "password", "client_secret", "code", "token", "access_token", "refresh_token", "authorization", "secret"
+})
+# Те же параметры внутри строк (URL редиректа с кодом, тела форм)
+SENSITIVE_PARAMS = re.compile(
+    r"(?i)\b(password|client_secret|code|token|access_token|refresh_token)=([^&\s]+)"
+)
+# Ключи словарей в repr (параметры запроса в тексте исключения SQLAlchemy)
+SENSITIVE_KEYS = re.compile(
+    r"""(?i)(['"])(\w*(?:password|secret|code|token|token_hash|jti)(?:_\d+)?)\1\s*:\s*"""
+    r"""(?:b?'(?:[^'\\]|\\.)*'|b?"(?:[^"\\]|\\.)*"|[^,}\]\s]+)"""
+)
+# Значение ключа в DETAIL нарушения ограничения PostgreSQL: Key (token_hash)=(...)
+SENSITIVE_DETAIL = re.compile(r"(?i)\b(Key \(\w*(?:password|secret|code|token|jti)\w*\)=)\((?:[^()]|\([^()]*\))*\)")
+
+# Стандартные атрибуты LogRecord; все остальные считаются структурированными полями из extra
+STANDARD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "request_id"
+}
+
+current_request_id: contextvars.ContextVar = contextvars.ContextVar("current_request_id", default=None)
+
+
+def _redact_key(match) -> str:
+    quote, key = match.group(1), match.group(2)
+    return f"{quote}{key}{quote}: {quote}{REDACTED}{quote}"
+
+
+def redact_text(text: str) -> str:
+    text = SENSITIVE_PARAMS.sub(lambda match: f"{match.group(1)}={REDACTED}", text)
+    text = SENSITIVE_DETAIL.sub(lambda match: f"{match.group(1)}({REDACTED})", text)
+    return SENSITIVE_KEYS.sub(_redact_key, text)
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись лога"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.utcfromtimestamp(record.created).isoformat(timespec="milliseconds") + "Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": redact_text(record.getMessage()),
+            "request_id": getattr(record, "request_id", None),
+        }
+        for key, value in record.__dict__.items():
+            if key in STANDARD_ATTRS:
+                continue
+            if key.lower() in SENSITIVE_FIELDS:
+                value = REDACTED
+            elif isinstance(value, str):
+                value = redact_text(value)
+            entry[key] = value
+        if record.exc_text:
+            entry["exception"] = redact_text(record.exc_text)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Кладет записи в ограниченную очередь; при переполнении запись отбрасывается, а не блокирует цикл событий"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Все, что зависит от контекста вызова, вычисляется до передачи в поток записи
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        record.request_id = current_request_id.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+log_handler: Optional[DroppingQueueHandler] = None
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging():
+    """Направляет корневой логгер в очередь; запись в stdout выполняет отдельный поток"""
+    global log_handler, _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    log_handler = DroppingQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+    root = logging.getLogger()
+    root.handlers = [log_handler]
+    root.setLevel(settings.LOG_LEVEL)
+
+    _listener = QueueListener(log_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    # Поток записи останавливается последним, чтобы записи хуков завершения не потерялись
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Дописывает оставшиеся в очереди записи и останавливает поток записи"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+access_logger = logging.getLogger("etude.access")
+
+
+class RequestLoggingMiddleware:
+    """ASGI middleware: идентификатор запроса и выборочный журнал запросов.
+
+    Для частых маршрутов (проверка токенов, метрики) в журнал попадает только доля запросов
+    по LOG_ROUTE_SAMPLE_RATES; ошибки сервера записываются всегда. Без аргументов доли берутся
+    из настроек при создании стека middleware (первый вызов приложения), а не при импорте.
+    """
+
+    def __init__(self, app, sample_rates: Optional[Dict[str, float]] = None, default_rate: Optional[float] = None):
+        self.app = app
+        self.sample_rates = settings.LOG_ROUTE_SAMPLE_RATES if sample_rates is None else sample_rates
+        self.default_rate = settings.LOG_ACCESS_SAMPLE_RATE if default_rate is None else default_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = current_request_id.set(request_id)
+        status_code = 500
+
+        async def send_with_request_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode())]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            route = getattr(scope.get("route"), "path", "other")
+            rate = self.sample_rates.get(route, self.default_rate)
+            if status_code >= 500 or random.random() < rate:
+                access_logger.info("request", extra={
+                    "method": scope["method"],
+                    "route": route,
+                    "path": scope["path"],
+                    "status": status_code,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                    "sample_rate": rate,
+                })
+            current_request_id.reset(token)
@@ -0,0 +1,69 @@
+from functools import lru_cache
+from typing import Optional
+
+from fastapi.responses import HTMLResponse
+from jinja2 import Environment, FileSystemLoader, Template
+from markupsafe import Markup
+
+from client_registry import RegisteredClient
+
+UNKNOWN_CLIENT_NAME = "Неизвестное приложение"
+# Scopes, от которых зависит блок с запрашиваемыми разрешениями
+DISPLAYED_SCOPES = ("documents", "write")
+
+
+class LoginPageRenderer:
+    """Страница входа OAuth без Jinja2Templates на каждый запрос.
+
+    Шаблоны компилируются один раз при старте, без проверки изменений файлов.
+    Блок с названием приложения и разрешениями зависит только от клиента и scopes,
+    поэтому рендерится один раз на сочетание и дальше вставляется готовой строкой.
+    """
+
+    def __init__(self, directory: str, fragment_cache_size: int = 256):
+        self.directory = directory
+        self._page: Optional[Template] = None
+        self._app_info: Optional[Template] = None
+        self.app_info = lru_cache(maxsize=fragment_cache_size)(self._render_app_info)
+
+    def load(self):
+        env = Environment(loader=FileSystemLoader(self.directory), autoescape=True, auto_reload=False)
+        self._page = env.get_template("login.html")
+        self._app_info = env.get_template("login_app_info.html")
+        self.app_info.cache_clear()
+
+    def _render_app_info(self, client_name: str, displayed_scopes: tuple) -> Markup:
+        return Markup(self._app_info.render(client_name=client_name, scopes=displayed_scopes))
+
+    def render(
+            self,
+            client: Optional[RegisteredClient],
+            client_id: Optional[str],
+            redirect_uri: Optional[str],
+            state: Optional[str],
+            scope: str,
+            error: Optional[str] = None,
+            status_code: int = 200
+    ) -> HTMLResponse:
+        if self._page is None:
+            self.load()
+        requested = scope.split()
+        displayed_scopes = tuple(name for name in DISPLAYED_SCOPES if name in requested)
+        client_name = client.display_name if client else UNKNOWN_CLIENT_NAME
+        content = self._page.render(
+            client_id=client_id or "",
+            redirect_uri=redirect_uri or "",
+            state=state or "",
+            scope=scope,
+            error=error,
+            app_info=self.app_info(client_name, displayed_scopes),
+        )
+        return HTMLResponse(content, status_code=status_code)
+
+    def error(self, error: str, client_id: Optional[str], redirect_uri: Optional[str], state: Optional[str],
+              scope: str, client: Optional[RegisteredClient] = None, status_code: int = 200) -> HTMLResponse:
+        """Страница входа с сообщением об ошибке - единая точка для всех ошибок authorize и login"""
+        return self.render(client, client_id, redirect_uri, state, scope, error=error, status_code=status_code)
+
+
+login_page = LoginPageRenderer("templates")
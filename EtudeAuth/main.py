@@ -1,44 +1,157 @@
-import asyncio
-import hashlib
+import logging
+import math
+from contextlib import asynccontextmanager
+from functools import lru_cache
 
-from fastapi import FastAPI, Depends, Security, HTTPException, status, Request, Form,Header, BackgroundTasks
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Depends, Security, HTTPException, status, Request, Form, Header, Query
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, exists, not_
+from sqlalchemy.orm import selectinload
 from typing import Optional, List, Annotated
 from datetime import datetime, timedelta
 import uuid
 from uuid import UUID
 from urllib.parse import urlencode
-from db import get_async_session, User, OAuthClient, RefreshToken, AuthToken, Document, \
+from db import get_async_session, get_engine, dispose_engine, pool_metrics, User, AuthToken, Document, \
     Company, Department
 from models import CompanyInDB, CompanyCreate, CompanyWithDepartments, CompanyUpdate, UserResponse, UserInDB, \
     DepartmentWithEmployees, DepartmentInDB, DepartmentUpdate, DepartmentCreate, UserUpdate, UserCreate, DocumentInDB, \
-    DocumentCreate, DocumentResponse, DocumentUpdate, TokenResponse, EmailLoginRequest, OrganizationStructure
-from oauth2 import create_access_token, create_refresh_token, validate_token, revoke_token
+    DocumentCreate, DocumentResponse, DocumentUpdate, DocumentSummary, DocumentDetail, TokenResponse, \
+    EmailLoginRequest, OrganizationStructure, TokenValidationItem, TokenValidationResult
+from oauth2 import create_access_token, create_refresh_token, validate_token, revoke_token, token_cache, \
+    get_key_ring
+from revocation import revocation_store, create_backend
+from user_cache import UserCache
+from response_cache import JsonResponseCache, etag_matches
+from approval_scheduler import ApprovalScheduler
+from passwords import password_hasher
+from client_registry import client_registry
+from notifications import notification_listener
+from login_page import login_page
+from auth_codes import redeem_auth_code, AuthCodePurger
+from pagination import MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, keyset_page, set_next_cursor, ndjson_response
+from metrics import registry, MetricsExporter, MetricsMiddleware
+import logging_setup
+from logging_setup import configure_logging, RequestLoggingMiddleware
+from refresh_tokens import new_refresh_token_row, consume_refresh_token, delete_refresh_token, \
+    RefreshTokenCollector
 from config import settings
-from fastapi.security import OAuth2PasswordBearer
-app = FastAPI(title="EtudeAuth - Система документооборота OAuth")
+from fastapi.security import OAuth2PasswordBearer, SecurityScopes
+logger = logging.getLogger("etude")
+
+# Фоновые задачи воркера: при импорте создаются только объекты, настройки они получают при запуске в lifespan
+# Очистка истекших кодов авторизации
+auth_code_purger = AuthCodePurger()
+
+# Очистка истекших и отозванных refresh токенов
+refresh_token_collector = RefreshTokenCollector()
+
+# Планировщик автоматического согласования документов (согласует просроченные пачками)
+approval_scheduler = ApprovalScheduler()
+
+metrics_exporter = MetricsExporter(registry)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Настройки, журнал, движок БД, ключи подписи, кэши, шаблоны страницы входа и фоновые задачи
+    создаются при старте воркера, а не при импорте main"""
+    configure_logging()
+    get_engine()
+    get_key_ring()
+    mount_static(app)
+    token_cache.configure(settings.TOKEN_CACHE_SIZE)
+    user_cache.configure(settings.USER_CACHE_TTL, settings.USER_CACHE_SIZE)
+    organization_structure_cache.configure(settings.ORG_STRUCTURE_CACHE_TTL)
+    password_hasher.start(settings.PASSWORD_HASH_ROUNDS, settings.PASSWORD_HASH_WORKERS,
+                          settings.PASSWORD_HASH_CONCURRENCY)
+    # Страница входа компилируется до первого запроса, а не на пике утренних входов
+    login_page.load()
+    # Загружаем отозванные токены и запускаем фоновую синхронизацию bloom-фильтра
+    revocation_store.configure(create_backend(settings.REVOCATION_BACKEND), settings.REVOCATION_BLOOM_CAPACITY,
+                               settings.REVOCATION_BLOOM_ERROR_RATE, settings.REVOCATION_SYNC_OVERLAP)
+    await revocation_store.start(settings.REVOCATION_REFRESH_INTERVAL, settings.REVOCATION_REBUILD_INTERVAL)
+    # LISTEN не работает через PgBouncer в transaction-режиме - остается только периодическое обновление
+    await client_registry.start(settings.OAUTH_CLIENTS_REFRESH_INTERVAL,
+                                settings.OAUTH_CLIENTS_LISTEN and not settings.DB_PGBOUNCER)
+    if not settings.DB_PGBOUNCER:
+        notification_listener.subscribe(ORGANIZATION_CHANNEL, organization_structure_cache.invalidate)
+    notification_listener.start()
+    auth_code_purger.start(settings.AUTH_CODE_PURGE_INTERVAL)
+    refresh_token_collector.start(settings.REFRESH_TOKEN_GC_INTERVAL, settings.REFRESH_TOKEN_GC_BATCH_SIZE)
+    metrics_exporter.start(settings.METRICS_DIR, settings.METRICS_DUMP_INTERVAL)
+    approval_scheduler.start(settings.AUTO_APPROVAL_TIME, settings.AUTO_APPROVAL_POLL_INTERVAL,
+                             settings.AUTO_APPROVAL_BATCH_SIZE)
+    try:
+        yield
+    finally:
+        await approval_scheduler.stop()
+        await metrics_exporter.stop()
+        await refresh_token_collector.stop()
+        await auth_code_purger.stop()
+        await notification_listener.stop()
+        await client_registry.stop()
+        await revocation_store.stop()
+        password_hasher.stop()
+        await dispose_engine()
+
+
+app = FastAPI(title="EtudeAuth - Система документооборота OAuth", lifespan=lifespan)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
+
+class SettingsCORSMiddleware(CORSMiddleware):
+    """CORS с доменами из ORIGINS: стек middleware собирается при первом вызове приложения,
+    поэтому настройки читаются тогда, а не при импорте main"""
+
+    def __init__(self, app, **kwargs):
+        super().__init__(app, allow_origins=settings.ORIGINS, **kwargs)
+
+
 # Настраиваем CORS
 app.add_middleware(
-    CORSMiddleware,
-    allow_origins=settings.ORIGINS,
+    SettingsCORSMiddleware,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "X-Request-ID"],
 )
 
-# Настраиваем шаблоны
-templates = Jinja2Templates(directory="templates")
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Идентификатор запроса и выборочный журнал запросов (доли из настроек)
+app.add_middleware(RequestLoggingMiddleware)
+
+# Метрики запросов (добавляется последним, чтобы учитывать время всех остальных middleware)
+app.add_middleware(MetricsMiddleware)
+
+def mount_static(app: FastAPI):
+    """Статика монтируется при старте воркера; повторный запуск lifespan второй маршрут не добавляет"""
+    from fastapi.staticfiles import StaticFiles
+
+    if not any(getattr(route, "name", None) == "static" for route in app.routes):
+        app.mount("/static", StaticFiles(directory="static"), name="static")
+
+
+# Шаблоны
+@lru_cache
+def get_templates() -> Jinja2Templates:
+    """Окружение Jinja для остальных страниц создается при первом обращении"""
+    return Jinja2Templates(directory="templates")
+
+
+# Кэш пользователей для горячего пути проверки токенов (локальный для воркера); размер и время жизни - в lifespan
+user_cache = UserCache()
+
 
 async def get_user(email: str, db: AsyncSession):
+    user = user_cache.get_by_email(email)
+    if user is not None:
+        # Присоединяем копию из кэша к сессии запроса без обращения к БД
+        return await db.merge(user, load=False)
+
     stmt = select(User).where(User.email == email)
     result = await db.execute(stmt)
     user = result.scalars().first()
@@ -46,9 +159,44 @@ async def get_user(email: str, db: AsyncSession):
     if not user:
         return None
 
+    user_cache.put(user)
+    return user
+
+
+async def get_user_by_id(user_id: UUID, db: AsyncSession):
+    user = user_cache.get_by_id(user_id)
+    if user is not None:
+        return await db.merge(user, load=False)
+
+    user = await db.get(User, user_id)
+
+    if not user:
+        return None
+
+    user_cache.put(user)
     return user
 
 
+async def get_users_by_emails(emails, db: AsyncSession):
+    """Возвращает словарь email -> пользователь, запрашивая отсутствующих в кэше одним запросом"""
+    users = {}
+    missing = set()
+    for email in emails:
+        user = user_cache.get_by_email(email)
+        if user is not None:
+            users[email] = user
+        else:
+            missing.add(email)
+
+    if missing:
+        result = await db.execute(select(User).where(User.email.in_(missing)))
+        for user in result.scalars():
+            user_cache.put(user)
+            users[user.email] = user
+
+    return users
+
+
 async def get_current_user(
         token: str = Depends(oauth2_scheme),
         db: AsyncSession = Depends(get_async_session)
@@ -60,7 +208,7 @@ async def get_current_user(
     )
 
     # Вызываем validate_token без указания scopes
-    token_data = validate_token(token)
+    token_data = await validate_token(token)
 
     if token_data is None:
         raise credentials_exception
@@ -78,6 +226,30 @@ async def get_current_active_user(
     # Удаляем проверку на disabled, так как мы решили убрать это поле
     return current_user
 
+
+async def get_scoped_user(
+        security_scopes: SecurityScopes,
+        token: str = Depends(oauth2_scheme),
+        db: AsyncSession = Depends(get_async_session)
+):
+    """Пользователь токена, в котором есть все scopes, указанные в Security(...)"""
+    token_data = await validate_token(token, security_scopes)
+    if token_data is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired token or insufficient permissions",
+            headers={"WWW-Authenticate": f'Bearer scope="{security_scopes.scope_str}"'},
+        )
+
+    user = await get_user(email=token_data.sub, db=db)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
+
 # Аутентификация пользователя (пример - в продакшене использовать БД)
 async def authenticate_user(db: AsyncSession, email: str, password: str):
     stmt = select(User).where(User.email == email)
@@ -87,30 +259,26 @@ async def authenticate_user(db: AsyncSession, email: str, password: str):
     if not user:
         return False
 
-    hashed_input = hashlib.sha256(password.encode()).hexdigest()
-    if user.hashed_password != hashed_input:
+    if not await verify_user_password(db, user, password):
         return False
 
     return user
 
 
-# Проверка клиента OAuth
-async def validate_client(db: AsyncSession, client_id: str, redirect_uri: str):
-    stmt = select(OAuthClient).where(OAuthClient.client_id == client_id)
-    result = await db.execute(stmt)
-    client = result.scalars().first()
-
-    if not client:
-        return False
-    if redirect_uri not in client.redirect_uris.split(","):
-        return False
-    return client
+async def verify_user_password(db: AsyncSession, user: User, password: str) -> bool:
+    """Проверяет пароль в пуле хэширования; устаревший хэш заменяется на bcrypt"""
+    valid, new_hash = await password_hasher.verify(password, user.hashed_password)
+    if valid and new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+        user_cache.invalidate(user=user)
+    return valid
 
 
 # Главная страница
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return get_templates().TemplateResponse("index.html", {"request": request})
 
 
 # Эндпоинт авторизации
@@ -124,139 +292,44 @@ async def authorize(
         state: Optional[str] = None,
         db: AsyncSession = Depends(get_async_session)
 ):
-    # Логирование для отладки
-    print(f"OAuth authorize request: client_id={client_id}, redirect_uri={redirect_uri}, scope={scope}, state={state}")
+    logger.info("OAuth authorize request", extra={
+        "client_id": client_id, "redirect_uri": redirect_uri, "scope": scope, "has_state": bool(state)
+    })
     
     # Проверка необходимых параметров
     if not response_type:
-        return templates.TemplateResponse(
-            "login.html",
-            {
-                "request": request,
-                "error": "Отсутствует обязательный параметр response_type",
-                "client_id": client_id or "",
-                "redirect_uri": redirect_uri or "",
-                "state": state or "",
-                "scope": scope,
-                "client_name": "Неизвестное приложение",
-                "scopes": scope.split()
-            }
-        )
+        return login_page.error("Отсутствует обязательный параметр response_type",
+                                client_id, redirect_uri, state, scope)
 
     if not client_id:
-        return templates.TemplateResponse(
-            "login.html",
-            {
-                "request": request,
-                "error": "Отсутствует обязательный параметр client_id",
-                "client_id": "",
-                "redirect_uri": redirect_uri or "",
-                "state": state or "",
-                "scope": scope,
-                "client_name": "Неизвестное приложение",
-                "scopes": scope.split()
-            }
-        )
+        return login_page.error("Отсутствует обязательный параметр client_id", client_id, redirect_uri, state, scope)
 
     if not redirect_uri:
-        return templates.TemplateResponse(
-            "login.html",
-            {
-                "request": request,
-                "error": "Отсутствует обязательный параметр redirect_uri",
-                "client_id": client_id,
-                "redirect_uri": "",
-                "state": state or "",
-                "scope": scope,
-                "client_name": "Неизвестное приложение",
-                "scopes": scope.split()
-            }
-        )
+        return login_page.error("Отсутствует обязательный параметр redirect_uri",
+                                client_id, redirect_uri, state, scope)
 
     # Проверяем, что клиент зарегистрирован
-    if client_id not in settings.OAUTH_CLIENTS:
-        return templates.TemplateResponse(
-            "login.html",
-            {
-                "request": request,
-                "error": "Недействительный client_id",
-                "client_id": client_id,
-                "redirect_uri": redirect_uri,
-                "state": state or "",
-                "scope": scope,
-                "client_name": "Неизвестное приложение",
-                "scopes": scope.split()
-            }
-        )
-
-    client = settings.OAUTH_CLIENTS[client_id]
+    client = client_registry.get(client_id)
+    if not client:
+        return login_page.error("Недействительный client_id", client_id, redirect_uri, state, scope)
 
     # Проверяем redirect_uri
-    if redirect_uri not in client["redirect_uris"]:
-        return templates.TemplateResponse(
-            "login.html",
-            {
-                "request": request,
-                "error": "Недействительный redirect_uri",
-                "client_id": client_id,
-                "redirect_uri": redirect_uri,
-                "state": state or "",
-                "scope": scope,
-                "client_name": client["name"] if "name" in client else client_id,
-                "scopes": scope.split()
-            }
-        )
+    if redirect_uri not in client.redirect_uris:
+        return login_page.error("Недействительный redirect_uri", client_id, redirect_uri, state, scope, client)
 
     # Проверяем, что используется code flow
     if response_type != "code":
-        return templates.TemplateResponse(
-            "login.html",
-            {
-                "request": request,
-                "error": "Поддерживается только flow authorization_code",
-                "client_id": client_id,
-                "redirect_uri": redirect_uri,
-                "state": state or "",
-                "scope": scope,
-                "client_name": client["name"] if "name" in client else client_id,
-                "scopes": scope.split()
-            }
-        )
-
-    # Разбиваем scope на отдельные разрешения
-    scopes = scope.split()
+        return login_page.error("Поддерживается только flow authorization_code",
+                                client_id, redirect_uri, state, scope, client)
 
     # Проверяем, что запрашиваемые scopes разрешены для клиента
-    invalid_scopes = [s for s in scopes if s not in client["allowed_scopes"]]
+    invalid_scopes = [s for s in scope.split() if s not in client.allowed_scopes]
     if invalid_scopes:
-        return templates.TemplateResponse(
-            "login.html",
-            {
-                "request": request,
-                "error": f"Scope(s) '{', '.join(invalid_scopes)}' не разрешены для данного клиента",
-                "client_id": client_id,
-                "redirect_uri": redirect_uri,
-                "state": state or "",
-                "scope": scope,
-                "client_name": client["name"] if "name" in client else client_id,
-                "scopes": scopes
-            }
-        )
+        return login_page.error(f"Scope(s) '{', '.join(invalid_scopes)}' не разрешены для данного клиента",
+                                client_id, redirect_uri, state, scope, client)
 
     # Отображаем страницу авторизации с явной передачей state
-    return templates.TemplateResponse(
-        "login.html",
-        {
-            "request": request,
-            "client_id": client_id,
-            "redirect_uri": redirect_uri,
-            "state": state if state else "",
-            "scope": scope,
-            "client_name": client["name"] if "name" in client else client_id,
-            "scopes": scopes,
-            "error": None
-        }
-    )
+    return login_page.render(client, client_id, redirect_uri, state, scope)
 
 
 # Обработка формы входа с сохранением state
@@ -271,44 +344,22 @@ async def login(
         state: Optional[str] = Form(None),
         db: AsyncSession = Depends(get_async_session)
 ):
-    # Логирование для отладки
-    print(f"OAuth login form submitted: client_id={client_id}, redirect_uri={redirect_uri}, scope={scope}, state={state}")
+    logger.info("OAuth login form submitted", extra={
+        "client_id": client_id, "redirect_uri": redirect_uri, "scope": scope, "has_state": bool(state)
+    })
     
+    client = client_registry.get(client_id)
+
     # Проверка наличия обязательных полей
     if not email or not password:
-        return templates.TemplateResponse(
-            "login.html",
-            {
-                "request": request,
-                "client_id": client_id,
-                "redirect_uri": redirect_uri,
-                "state": state if state else "",
-                "scope": scope,
-                "error": "Введите email и пароль",
-                "client_name": settings.OAUTH_CLIENTS[client_id]["name"] if "name" in settings.OAUTH_CLIENTS[
-                    client_id] else client_id,
-                "scopes": scope.split()
-            },
-            status_code=400
-        )
+        return login_page.error("Введите email и пароль", client_id, redirect_uri, state, scope, client,
+                                status_code=400)
 
     try:
         # Проверяем, что клиент существует
-        if client_id not in settings.OAUTH_CLIENTS:
-            return templates.TemplateResponse(
-                "login.html",
-                {
-                    "request": request,
-                    "client_id": client_id,
-                    "redirect_uri": redirect_uri,
-                    "state": state if state else "",
-                    "scope": scope,
-                    "error": "Недействительный client_id",
-                    "client_name": "Неизвестное приложение",
-                    "scopes": scope.split()
-                },
-                status_code=400
-            )
+        if not client:
+            return login_page.error("Недействительный client_id", client_id, redirect_uri, state, scope,
+                                    status_code=400)
 
         # Аутентификация пользователя
         # Исправленный запрос к базе данных
@@ -317,43 +368,12 @@ async def login(
         user = result.scalars().first()
 
         if not user:
-            return templates.TemplateResponse(
-                "login.html",
-                {
-                    "request": request,
-                    "client_id": client_id,
-                    "redirect_uri": redirect_uri,
-                    "state": state if state else "",
-                    "scope": scope,
-                    "error": "Пользователь с таким email не найден",
-                    "client_name": settings.OAUTH_CLIENTS[client_id]["name"] if "name" in settings.OAUTH_CLIENTS[
-                        client_id] else client_id,
-                    "scopes": scope.split()
-                },
-                status_code=400
-            )
-
-        # Простая проверка пароля (исправлено преобразование типов)
-        import hashlib
-        hashed_input = hashlib.sha256(password.encode()).hexdigest()
-
-        if user.hashed_password != hashed_input:
-            return templates.TemplateResponse(
-                "login.html",
-                {
-                    "request": request,
-                    "client_id": client_id,
-                    "redirect_uri": redirect_uri,
-                    "state": state if state else "",
-                    "scope": scope,
-                    "error": "Неверный пароль",
-                    "client_name": settings.OAUTH_CLIENTS[client_id]["name"] if "name" in settings.OAUTH_CLIENTS[
-                        client_id] else client_id,
-                    "scopes": scope.split()
-                },
-                status_code=400
-            )
+            return login_page.error("Пользователь с таким email не найден", client_id, redirect_uri, state, scope,
+                                    client, status_code=400)
 
+        if not await verify_user_password(db, user, password):
+            return login_page.error("Неверный пароль", client_id, redirect_uri, state, scope, client,
+                                    status_code=400)
 
         # Генерируем код авторизации
         code = str(uuid.uuid4())
@@ -374,36 +394,20 @@ async def login(
         params = {"code": code}
         if state:
             params["state"] = state
-            print(f"Including state in redirect params: {state}")
 
-        # Формируем URL для редиректа
+        # Формируем URL для редиректа (в лог не пишем - он содержит код авторизации)
         redirect_url = f"{redirect_uri}?{urlencode(params)}"
-        print(f"Redirecting to: {redirect_url}")
+        logger.info("OAuth login succeeded", extra={"client_id": client_id, "redirect_uri": redirect_uri})
 
         # Перенаправляем на redirect_uri с кодом авторизации
         return RedirectResponse(url=redirect_url, status_code=303)
 
-    except Exception as e:
-        # Логирование ошибки
-        print(f"Error during login: {str(e)}")
+    except Exception:
+        logger.exception("OAuth login failed", extra={"client_id": client_id})
 
         # Отображаем пользователю страницу с ошибкой
-        return templates.TemplateResponse(
-            "login.html",
-            {
-                "request": request,
-                "client_id": client_id,
-                "redirect_uri": redirect_uri,
-                "state": state if state else "",
-                "scope": scope,
-                "error": "Произошла ошибка при авторизации. Пожалуйста, попробуйте снова позже.",
-                "client_name": settings.OAUTH_CLIENTS[client_id][
-                    "name"] if client_id in settings.OAUTH_CLIENTS and "name" in settings.OAUTH_CLIENTS[
-                    client_id] else client_id,
-                "scopes": scope.split()
-            },
-            status_code=500
-        )
+        return login_page.error("Произошла ошибка при авторизации. Пожалуйста, попробуйте снова позже.",
+                                client_id, redirect_uri, state, scope, client, status_code=500)
 
 
 # Обмен кода авторизации на токены
@@ -418,46 +422,20 @@ async def token(
         db: AsyncSession = Depends(get_async_session)
 ):
     # Проверяем клиента
-    if client_id not in settings.OAUTH_CLIENTS or settings.OAUTH_CLIENTS[client_id]["client_secret"] != client_secret:
+    if not client_registry.authenticate(client_id, client_secret):
         return JSONResponse(
             content={"error": "invalid_client", "error_description": "Invalid client credentials"},
             status_code=401
         )
 
     if grant_type == "authorization_code":
-        # Проверяем код авторизации
-        stmt = select(AuthToken).where(AuthToken.code == code)
-        result = await db.execute(stmt)
-        res_code = result.scalars().first()
-
-        if not res_code or code != res_code.code:
-            return JSONResponse(
-                content={"error": "invalid_grant", "error_description": "Invalid authorization code"},
-                status_code=400
-            )
-
-        stmt = select(AuthToken).where(AuthToken.code == code)
-        result = await db.execute(stmt)
-        code_data = result.scalars().first()
-
-        # Проверяем время жизни кода
-        if datetime.utcnow() > code_data.expires_at:
-            return JSONResponse(
-                content={"error": "invalid_grant", "error_description": "Authorization code expired"},
-                status_code=400
-            )
-
-        # Проверяем redirect_uri
-        if code_data.redirect_uri != redirect_uri:
+        # Погашаем код: удаление вместе с проверкой срока, клиента и redirect_uri.
+        # Удаление фиксируется вместе с refresh токеном, поэтому код нельзя использовать повторно
+        code_data = await redeem_auth_code(db, code, client_id, redirect_uri)
+        if not code_data:
             return JSONResponse(
-                content={"error": "invalid_grant", "error_description": "Redirect URI mismatch"},
-                status_code=400
-            )
-
-        # Проверяем client_id
-        if code_data.client_id != client_id:
-            return JSONResponse(
-                content={"error": "invalid_grant", "error_description": "Client ID mismatch"},
+                content={"error": "invalid_grant",
+                         "error_description": "Invalid, expired or mismatched authorization code"},
                 status_code=400
             )
 
@@ -471,14 +449,8 @@ async def token(
         access_token = create_access_token(access_token_data)
         refresh_token_value = create_refresh_token(access_token_data)
 
-        # Сохраняем refresh token в БД
-        db_refresh_token = RefreshToken(
-            token=refresh_token_value,
-            email=code_data.email,
-            scopes=",".join(code_data.scopes),
-            client_id=client_id
-        )
-        db.add(db_refresh_token)
+        # Сохраняем хэш refresh токена в БД
+        db.add(new_refresh_token_row(refresh_token_value, code_data.email, ",".join(code_data.scopes), client_id))
         await db.commit()
 
         # Возвращаем токены
@@ -491,39 +463,37 @@ async def token(
         }
 
     elif grant_type == "refresh_token":
-        # Проверяем refresh token - исправленный код
-        stmt = select(RefreshToken).where(RefreshToken.token == refresh_token)
-        result = await db.execute(stmt)
-        refresh_token_obj = result.scalars().first()
-
-        if not refresh_token_obj:
+        # Погашаем действующий refresh token клиента (ротация: каждый токен используется один раз)
+        token_row = await consume_refresh_token(db, refresh_token, client_id)
+        if not token_row:
             return JSONResponse(
-                content={"error": "invalid_grant", "error_description": "Invalid refresh token"},
+                content={"error": "invalid_grant", "error_description": "Invalid or expired refresh token"},
                 status_code=400
             )
 
-        # Проверяем client_id
-        if refresh_token_obj.client_id != client_id:
-            return JSONResponse(
-                content={"error": "invalid_grant", "error_description": "Client ID mismatch"},
-                status_code=400
-            )
+        scopes = token_row.scopes.split(",") if token_row.scopes else []
 
-        # Создаем новый access token
+        # Создаем новую пару токенов
         access_token_data = {
-            "sub": refresh_token_obj.email,
-            "scopes": refresh_token_obj.scopes.split(","),
+            "sub": token_row.email,
+            "scopes": scopes,
             "client_id": client_id
         }
 
         new_access_token = create_access_token(access_token_data)
+        new_refresh_token = create_refresh_token(access_token_data)
+
+        db.add(new_refresh_token_row(new_refresh_token, token_row.email, token_row.scopes, client_id,
+                                     token_row.user_id))
+        await db.commit()
 
-        # Возвращаем новый access token
+        # Возвращаем новые токены
         return {
             "access_token": new_access_token,
             "token_type": "bearer",
             "expires_in": settings.JWT_ACCESS_TTL,
-            "scope": refresh_token_obj.scopes
+            "refresh_token": new_refresh_token,
+            "scope": " ".join(scopes)
         }
 
     else:
@@ -533,6 +503,27 @@ async def token(
         )
 
 
+MAX_BATCH_VALIDATION_SIZE = 500  # Максимальное число токенов в пакетной проверке
+
+INVALID_TOKEN_RESULT = {"valid": False, "reason": "Invalid token"}
+
+
+def token_validation_result(token_data, user):
+    """Формирует ответ проверки токена для найденного пользователя"""
+    if user is None:
+        return {"valid": False, "reason": "User not found"}
+
+    return {
+        "valid": True,
+        "user": {
+            "email": user.email,
+            "full_name": f"{user.surname}" + f"{user.name}" + f"{user.patronymic}"
+        },
+        "scopes": token_data.scopes,
+        "expires_at": token_data.exp.timestamp() if token_data.exp else None
+    }
+
+
 # Эндпоинт для проверки токена
 @app.post("/api/token/validate")
 async def validate_token_endpoint(
@@ -541,34 +532,100 @@ async def validate_token_endpoint(
         db: AsyncSession = Depends(get_async_session)
 ):
     # Проверяем токен
-    token_data = validate_token(token, required_scopes.split() if required_scopes else None)
+    token_data = await validate_token(token, required_scopes.split() if required_scopes else None)
     if not token_data:
         return JSONResponse(
-            content={"valid": False, "reason": "Invalid token"},
+            content=INVALID_TOKEN_RESULT,
             status_code=200
         )
 
-    # Получаем информацию о пользователе - исправленный запрос
-    stmt = select(User).where(User.email == token_data.sub)
-    result = await db.execute(stmt)
-    user = result.scalars().first()
-
+    # Получаем информацию о пользователе
+    user = await get_user(email=token_data.sub, db=db)
 
     # Возвращаем информацию о валидности токена
     return JSONResponse(
-        content={
-            "valid": True,
-            "user": {
-                "email": user.email,
-                "full_name": f"{user.surname}" + f"{user.name}" + f"{user.patronymic}"
-            },
-            "scopes": token_data.scopes,
-            "expires_at": token_data.exp.timestamp() if token_data.exp else None
-        },
+        content=token_validation_result(token_data, user),
         status_code=200
     )
 
 
+# Пакетная проверка токенов за один запрос
+@app.post("/api/token/validate/batch", response_model=List[TokenValidationResult],
+          response_model_exclude_none=True)
+async def validate_tokens_batch(
+        items: List[TokenValidationItem],
+        db: AsyncSession = Depends(get_async_session)
+):
+    if len(items) > MAX_BATCH_VALIDATION_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Batch size must not exceed {MAX_BATCH_VALIDATION_SIZE} tokens"
+        )
+
+    # Сначала проверяем все токены, затем загружаем пользователей одним запросом
+    tokens_data = [await validate_token(item.token, item.required_scopes) for item in items]
+    users = await get_users_by_emails({token_data.sub for token_data in tokens_data if token_data}, db)
+
+    return [
+        token_validation_result(token_data, users.get(token_data.sub)) if token_data else INVALID_TOKEN_RESULT
+        for token_data in tokens_data
+    ]
+
+
+# Открытые ключи подписи для локальной проверки токенов на стороне ресурсных серверов
+@app.get("/.well-known/jwks.json")
+async def jwks():
+    key_ring = get_key_ring()
+    return Response(
+        content=key_ring.jwks_json if key_ring else b'{"keys": []}',
+        media_type="application/json",
+        headers={"Cache-Control": "public, max-age=300"}
+    )
+
+
+# Статистика кэша проверенных токенов текущего воркера (только для авторизованных пользователей)
+@app.get("/api/token/cache/stats")
+async def token_cache_stats(current_user: User = Depends(get_current_active_user)):
+    return token_cache.stats()
+
+
+# Метрики, вычисляемые в момент сбора
+registry.callback(
+    "etude_cache_requests_total", "Cache lookups by cache and result", "counter", ("cache", "result"),
+    lambda: {
+        (name, result): value
+        for name, cache in (("token", token_cache), ("user", user_cache),
+                            ("organization_structure", organization_structure_cache))
+        for result, value in (("hit", cache.hits), ("miss", cache.misses))
+    }
+)
+registry.callback(
+    "etude_db_pool_connections_in_use", "Database connections checked out of the pool", "gauge", (),
+    lambda: {(): pool_metrics.in_use}
+)
+registry.callback(
+    "etude_db_pool_checkout_timeouts_total", "Pool checkouts that timed out", "counter", (),
+    lambda: {(): pool_metrics.timeouts}
+)
+
+registry.callback(
+    "etude_log_records_dropped_total", "Log records dropped because the log queue was full", "counter", (),
+    lambda: {(): logging_setup.log_handler.dropped if logging_setup.log_handler else 0}
+)
+
+# Метрики в формате Prometheus, суммированные по всем воркерам
+@app.get("/metrics")
+async def metrics():
+    return Response(content=metrics_exporter.collect(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# Состояние пула соединений текущего воркера: ожидание выдачи и занятые соединения
+# (только для авторизованных пользователей)
+@app.get("/api/db/pool/stats")
+async def db_pool_stats(current_user: User = Depends(get_current_active_user)):
+    return pool_metrics.stats(get_engine().sync_engine.pool)
+
+
 # Эндпоинт для отзыва токена
 @app.post("/oauth/revoke")
 async def revoke_token_endpoint(
@@ -578,14 +635,19 @@ async def revoke_token_endpoint(
         db: AsyncSession = Depends(get_async_session)
 ):
     # Проверяем клиента
-    if client_id not in settings.OAUTH_CLIENTS or settings.OAUTH_CLIENTS[client_id]["client_secret"] != client_secret:
+    if not client_registry.authenticate(client_id, client_secret):
         return JSONResponse(
             content={"error": "invalid_client", "error_description": "Invalid client credentials"},
             status_code=401
         )
 
-    # Отзываем токен
-    if revoke_token(token):
+    # Отзываем токен; refresh токен сразу удаляем из хранилища
+    revoked = await revoke_token(token)
+    if await delete_refresh_token(db, token):
+        await db.commit()
+        revoked = True
+
+    if revoked:
         return JSONResponse(content={"success": True}, status_code=200)
     else:
         return JSONResponse(content={"success": False}, status_code=400)
@@ -609,197 +671,74 @@ async def get_user_info(
     }
 
 
-# API для получения списка документов
-@app.get("/api/documents")
-async def get_documents(
-        request: Request,
-        db: AsyncSession = Depends(get_async_session),
-        authorization: Optional[str] = Header(None)
-):
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authorization header",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
-
-    try:
-        auth_parts = authorization.split(" ")
-        if len(auth_parts) < 2:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authorization format",
-                headers={"WWW-Authenticate": "Bearer"}
-            )
-        token = auth_parts[1]
-    except Exception:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authorization format",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
-
-    token_data = validate_token(token, ["documents"])
+# Документы владельца токена. Отдельный префикс: пути /api/documents/... занимают CRUD эндпоинты ниже
+def document_columns(*fields: str):
+    """Столбцы документа и отдельные поля DocInfo вместо всего JSON"""
+    return (Document.id, Document.EtudeDocID, Document.isApproval, Document.created_at,
+            *(Document.DocInfo[field].astext.label(field) for field in fields))
 
-    if not token_data:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
 
-    # В реальном приложении здесь был бы запрос к БД
-    # Для демонстрации возвращаем фиктивные данные
-    return [
-        {
-            "id": 1,
-            "title": "Квартальный отчет",
-            "created_at": datetime.utcnow() - timedelta(days=5),
-            "type": "report"
-        },
-        {
-            "id": 2,
-            "title": "Техническое задание",
-            "created_at": datetime.utcnow() - timedelta(days=2),
-            "type": "task"
-        }
-    ]
+@app.get("/api/user/me/documents", response_model=List[DocumentSummary])
+async def read_my_documents(
+        response: Response,
+        current_user: Annotated[User, Security(get_scoped_user, scopes=["documents"])],
+        after: Optional[int] = None,
+        limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+        db: AsyncSession = Depends(get_async_session)
+):
+    # Один проход по индексу ix_documents_owner_id_id (owner_id, id)
+    query = select(*document_columns("title", "type")).where(Document.owner_id == current_user.id)
+    documents = (await db.execute(keyset_page(query, Document.id, after, limit))).mappings().all()
+    set_next_cursor(response, documents, limit, cursor=lambda document: document["id"])
+    return documents
 
 
-# API для получения конкретного документа
-@app.get("/api/documents/{document_id}")
-async def get_document(
+@app.get("/api/user/me/documents/{document_id}", response_model=DocumentDetail)
+async def read_my_document(
         document_id: int,
-        request: Request,
-        db: AsyncSession = Depends(get_async_session),
-        authorization: Optional[str] = Header(None)
+        current_user: Annotated[User, Security(get_scoped_user, scopes=["documents"])],
+        db: AsyncSession = Depends(get_async_session)
 ):
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authorization header",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
-
-    try:
-        auth_parts = authorization.split(" ")
-        if len(auth_parts) < 2:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authorization format",
-                headers={"WWW-Authenticate": "Bearer"}
-            )
-        token = auth_parts[1]
-    except Exception:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authorization format",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
-
-    token_data = validate_token(token, ["documents"])
-
-    if not token_data:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
-
-    # В реальном приложении здесь был бы запрос к БД
-    # Для демонстрации возвращаем фиктивные данные
-    if document_id == 1:
-        return {
-            "id": 1,
-            "title": "Квартальный отчет",
-            "content": "Содержание квартального отчета...",
-            "created_at": datetime.utcnow() - timedelta(days=5),
-            "type": "report"
-        }
-    elif document_id == 2:
-        return {
-            "id": 2,
-            "title": "Техническое задание",
-            "content": "Содержание технического задания...",
-            "created_at": datetime.utcnow() - timedelta(days=2),
-            "type": "task"
-        }
-    else:
+    # Чужой документ неотличим от несуществующего
+    query = select(*document_columns("title", "type", "description")).where(
+        Document.id == document_id, Document.owner_id == current_user.id
+    )
+    document = (await db.execute(query)).mappings().first()
+    if document is None:
         raise HTTPException(status_code=404, detail="Document not found")
+    return document
 
 
-# API для создания документа
-@app.post("/api/documents")
-async def create_document(
-        request: Request,
+@app.post("/api/user/me/documents", response_model=DocumentDetail, status_code=status.HTTP_201_CREATED)
+async def create_my_document(
+        current_user: Annotated[User, Security(get_scoped_user, scopes=["documents", "write"])],
         title: str = Form(...),
         content: str = Form(...),
-        db: AsyncSession = Depends(get_async_session),
-        authorization: Optional[str] = Header(None)
+        type: str = Form("document"),
+        db: AsyncSession = Depends(get_async_session)
 ):
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authorization header",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
-
-    try:
-        auth_parts = authorization.split(" ")
-        if len(auth_parts) < 2:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authorization format",
-                headers={"WWW-Authenticate": "Bearer"}
-            )
-        token = auth_parts[1]
-    except Exception:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authorization format",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
-
-    token_data = validate_token(token, ["documents", "write"])
-
-    if not token_data:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token or insufficient permissions",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
-
-    # Получаем пользователя из БД
-    stmt = select(User).where(User.email == token_data.sub)
-    result = await db.execute(stmt)
-    user = result.scalars().first()
-
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
-
-    # В реальном приложении здесь был бы запрос к БД для сохранения документа
-    # Для демонстрации создаем новый документ
-    new_document = {
-        "id": 3,
-        "title": title,
-        "content": content,
-        "created_at": datetime.utcnow(),
-        "type": "document",
-        "owner_id": user.id
-    }
-
-    return new_document
+    # Документ создан не в EtudeBackend - EtudeDocID у него нет
+    document = Document(
+        owner_id=current_user.id,
+        coordinating={},
+        isApproval=False,
+        DocInfo={"title": title, "description": content, "type": type}
+    )
+    db.add(document)
+    await db.flush()
+    # created_at заполняет now() на стороне БД - в той же шкале, что и сравнение в планировщике согласования
+    await db.refresh(document, ["created_at"])
+    created = DocumentDetail(id=document.id, isApproval=False, created_at=document.created_at,
+                             title=title, type=type, description=content)
+    await db.commit()
+    return created
 
 
 # Модель для запроса регистрации
 @app.get("/register", response_class=HTMLResponse)
 async def register_form(request: Request):
     """Отображает форму регистрации нового пользователя"""
-    return templates.TemplateResponse(
+    return get_templates().TemplateResponse(
         "register.html",
         {
             "request": request,
@@ -823,7 +762,7 @@ async def register(
     """Регистрирует нового пользователя в системе"""
     # Проверяем, совпадают ли пароли
     if password != password_confirm:
-        return templates.TemplateResponse(
+        return get_templates().TemplateResponse(
             "register.html",
             {
                 "request": request,
@@ -842,7 +781,7 @@ async def register(
     existing_user = result.scalars().first()
 
     if existing_user:
-        return templates.TemplateResponse(
+        return get_templates().TemplateResponse(
             "register.html",
             {
                 "request": request,
@@ -856,10 +795,7 @@ async def register(
         )
 
     try:
-        # В реальном приложении нужно хешировать пароль
-        # Для примера используем простой хеш
-        import hashlib
-        hashed_password = hashlib.sha256(password.encode()).hexdigest()
+        hashed_password = await password_hasher.hash(password)
 
         # Создаем нового пользователя
         new_user = User(
@@ -873,15 +809,16 @@ async def register(
 
         db.add(new_user)
         await db.commit()
+        user_cache.invalidate(email=email)
 
         # Переадресуем на страницу успешной регистрации
-        return templates.TemplateResponse(
+        return get_templates().TemplateResponse(
             "register_success.html",
             {"request": request, "email": email}
         )
     except Exception as e:
         await db.rollback()
-        return templates.TemplateResponse(
+        return get_templates().TemplateResponse(
             "register.html",
             {
                 "request": request,
@@ -895,39 +832,38 @@ async def register(
         )
 
 
-AUTO_APPROVAL_TIME = 300  # 5 минут
-
-
-# Функция фонового задания для автоматического согласования документов
-async def auto_approve_document(document_id: int, db: AsyncSession  = Depends(get_async_session)):
-    await asyncio.sleep(AUTO_APPROVAL_TIME)
-
-    document = await db.get(Document, document_id)
-    if document and not document.isApproval:
-        document.isApproval = True
-        db.add(document)
-        await db.commit()
-
-
 # CRUD для Company
 @app.post("/api/companies/", response_model=CompanyInDB, status_code=status.HTTP_201_CREATED)
 async def create_company(company: CompanyCreate, db: AsyncSession = Depends(get_async_session)):
     db_company = Company(**company.model_dump())
     db.add(db_company)
     await db.commit()
+    organization_structure_cache.invalidate()
     await db.refresh(db_company)
     return db_company
 
 
 @app.get("/api/companies/", response_model=List[CompanyInDB])
-async def read_companies(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_async_session)):
-    companies = await db.execute(select(Company).offset(skip).limit(limit))
+async def read_companies(
+        response: Response,
+        after: Optional[UUID] = None,
+        limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+        format: str = Query("json", pattern="^(json|ndjson)$"),
+        db: AsyncSession = Depends(get_async_session)
+):
+    if format == "ndjson":
+        query = keyset_page(select(Company), Company.id, after, None)
+        return ndjson_response(query, lambda company: CompanyInDB.model_validate(
+            company, from_attributes=True).model_dump_json())
+
+    companies = await db.execute(keyset_page(select(Company), Company.id, after, limit))
     companies = companies.scalars().all()
+    set_next_cursor(response, companies, limit)
     return companies
 
 
 @app.get("/api/companies/{company_id}", response_model=CompanyWithDepartments)
-async def read_company(company_id: int, db: AsyncSession = Depends(get_async_session)):
+async def read_company(company_id: UUID, db: AsyncSession = Depends(get_async_session)):
     company = await db.execute(select(Company).filter(Company.id == company_id))
     company = company.scalars().first()
     if company is None:
@@ -936,7 +872,7 @@ async def read_company(company_id: int, db: AsyncSession = Depends(get_async_ses
 
 
 @app.put("/api/companies/{company_id}", response_model=CompanyInDB)
-async def update_company(company_id: int, company: CompanyUpdate, db: AsyncSession = Depends(get_async_session)):
+async def update_company(company_id: UUID, company: CompanyUpdate, db: AsyncSession = Depends(get_async_session)):
     db_company = await db.execute(select(Company).filter(Company.id == company_id))
     db_company = db_company.scalars().first()
     if db_company is None:
@@ -948,12 +884,13 @@ async def update_company(company_id: int, company: CompanyUpdate, db: AsyncSessi
 
     db.add(db_company)
     await db.commit()
+    organization_structure_cache.invalidate()
     await db.refresh(db_company)
     return db_company
 
 
 @app.delete("/api/companies/{company_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_company(company_id: int, db: AsyncSession = Depends(get_async_session)):
+async def delete_company(company_id: UUID, db: AsyncSession = Depends(get_async_session)):
     db_company = await db.execute(select(Company).filter(Company.id == company_id))
     db_company = db_company.scalars().first()
     if db_company is None:
@@ -961,6 +898,7 @@ async def delete_company(company_id: int, db: AsyncSession = Depends(get_async_s
 
     await db.delete(db_company)
     await db.commit()
+    organization_structure_cache.invalidate()
     return None
 
 
@@ -985,16 +923,19 @@ async def create_department(
     db_department = Department(**department.model_dump())
     db.add(db_department)
     await db.commit()
+    organization_structure_cache.invalidate()
     await db.refresh(db_department)
     return db_department
 
 
 @app.get("/api/departments/", response_model=List[DepartmentInDB])
 async def read_departments(
+        response: Response,
         current_user: User = Depends(get_current_active_user),
-        skip: int = 0,
-        limit: int = 100,
-        company_id: Optional[int] = None,
+        after: Optional[UUID] = None,
+        limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+        company_id: Optional[UUID] = None,
+        format: str = Query("json", pattern="^(json|ndjson)$"),
         db: AsyncSession = Depends(get_async_session)
 ):
     query = select(Department)
@@ -1003,15 +944,19 @@ async def read_departments(
     if company_id:
         query = query.where(Department.company_id == company_id)
 
-    query = query.offset(skip).limit(limit)
-    result = await db.execute(query)
+    if format == "ndjson":
+        return ndjson_response(keyset_page(query, Department.id, after, None), lambda department: (
+            DepartmentInDB.model_validate(department, from_attributes=True).model_dump_json()))
+
+    result = await db.execute(keyset_page(query, Department.id, after, limit))
     departments = result.scalars().all()
+    set_next_cursor(response, departments, limit)
     return departments
 
 
 @app.get("/api/departments/{department_id}", response_model=DepartmentWithEmployees)
 async def read_department(
-        department_id: int,
+        department_id: UUID,
         current_user: User = Depends(get_current_active_user),
         db: AsyncSession = Depends(get_async_session)
 ):
@@ -1047,7 +992,7 @@ async def read_department(
 
 @app.put("/api/departments/{department_id}", response_model=DepartmentInDB)
 async def update_department(
-        department_id: int,
+        department_id: UUID,
         department: DepartmentUpdate,
         current_user: User = Depends(get_current_active_user),
         db: AsyncSession = Depends(get_async_session)
@@ -1079,13 +1024,14 @@ async def update_department(
 
     db.add(db_department)
     await db.commit()
+    organization_structure_cache.invalidate()
     await db.refresh(db_department)
     return db_department
 
 
 @app.delete("/api/departments/{department_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_department(
-        department_id: int,
+        department_id: UUID,
         current_user: User = Depends(get_current_active_user),
         db: AsyncSession = Depends(get_async_session)
 ):
@@ -1110,10 +1056,24 @@ async def delete_department(
 
     await db.delete(db_department)
     await db.commit()
+    organization_structure_cache.invalidate()
     return None
 
 
 # CRUD для User
+def user_with_department_query():
+    """Запрос пользователей вместе с именем департамента (без отдельного запроса на каждого)"""
+    return select(User, Department.name).outerjoin(Department, User.department_id == Department.id)
+
+
+def build_user_response(user: User, department_name: Optional[str] = None):
+    """Формирует UserResponse из ORM-объекта пользователя и имени его департамента"""
+    return UserResponse(
+        **UserInDB.model_validate(user, from_attributes=True).model_dump(),
+        department_name=department_name
+    )
+
+
 @app.post("/api/users/", response_model=UserInDB, status_code=status.HTTP_201_CREATED)
 async def create_user(
         user: UserCreate,
@@ -1143,8 +1103,7 @@ async def create_user(
             )
 
     # Хэшируем пароль перед сохранением
-    import hashlib
-    hashed_password = hashlib.sha256(user.password.encode()).hexdigest()
+    hashed_password = await password_hasher.hash(user.password)
 
     # Создаем пользователя
     db_user = User(
@@ -1161,45 +1120,36 @@ async def create_user(
 
     db.add(db_user)
     await db.commit()
+    organization_structure_cache.invalidate()
     await db.refresh(db_user)
     return db_user
 
 
 @app.get("/api/users/", response_model=List[UserResponse])
 async def read_users(
+        response: Response,
         current_user: User = Depends(get_current_active_user),
-        skip: int = 0,
-        limit: int = 100,
-        department_id: Optional[int] = None,
+        after: Optional[UUID] = None,
+        limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+        department_id: Optional[UUID] = None,
+        format: str = Query("json", pattern="^(json|ndjson)$"),
         db: AsyncSession = Depends(get_async_session)
 ):
-    query = select(User)
+    # Пользователи вместе с именами департаментов - один запрос на страницу
+    query = user_with_department_query()
 
     # Фильтрация по департаменту, если указан department_id
     if department_id:
         query = query.where(User.department_id == department_id)
 
-    query = query.offset(skip).limit(limit)
-    result = await db.execute(query)
-    users = result.scalars().all()
-
-    # Получаем имена департаментов для каждого пользователя
-    user_responses = []
-    for user in users:
-        user_dict = UserInDB.model_validate(user).model_dump()
-
-        # Добавляем имя департамента, если пользователь привязан к департаменту
-        if user.department_id:
-            department_query = select(Department).where(Department.id == user.department_id)
-            department_result = await db.execute(department_query)
-            department = department_result.scalars().first()
-
-            if department:
-                user_dict["department_name"] = department.name
-
-        user_responses.append(UserResponse(**user_dict))
+    if format == "ndjson":
+        return ndjson_response(keyset_page(query, User.id, after, None),
+                               lambda row: build_user_response(*row).model_dump_json(), scalars=False)
 
-    return user_responses
+    result = await db.execute(keyset_page(query, User.id, after, limit))
+    users = [build_user_response(user, department_name) for user, department_name in result.all()]
+    set_next_cursor(response, users, limit)
+    return users
 
 
 @app.get("/api/users/{user_id}", response_model=UserResponse)
@@ -1207,38 +1157,13 @@ async def read_user(
         user_id: UUID,
         db: AsyncSession = Depends(get_async_session)
 ):
-    user_query = select(User).where(User.id == user_id)
-    result = await db.execute(user_query)
-    user = result.scalars().first()
+    result = await db.execute(user_with_department_query().where(User.id == user_id))
+    row = result.first()
 
-    if user is None:
+    if row is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    # Создаем базовый ответ
-    user_dict = {
-        "id": user.id,
-        "org_email": user.org_email,
-        "name": user.name,
-        "surname": user.surname,
-        "patronymic": user.patronymic,
-        "position": user.position,
-        "EtudeID": user.EtudeID,
-        "department_id": user.department_id
-    }
-    user_model = UserInDB(**user_dict)
-    user_dict = user_model.model_dump()
-
-
-    # Добавляем имя департамента, если пользователь привязан к департаменту
-    if user.department_id:
-        department_query = select(Department).where(Department.id == user.department_id)
-        department_result = await db.execute(department_query)
-        department = department_result.scalars().first()
-
-        if department:
-            user_dict["department_name"] = department.name
-
-    return UserResponse(**user_dict)
+    return build_user_response(*row)
 
 
 @app.put("/api/users/{user_id}", response_model=UserResponse)
@@ -1248,25 +1173,30 @@ async def update_user(
         current_user: User = Depends(get_current_active_user),
         db: AsyncSession = Depends(get_async_session)
 ):
-    # Проверяем существование пользователя
-    user_query = select(User).where(User.id == user_id)
-    result = await db.execute(user_query)
-    db_user = result.scalars().first()
+    # Проверяем существование пользователя (сразу получаем имя его департамента)
+    result = await db.execute(user_with_department_query().where(User.id == user_id))
+    row = result.first()
 
-    if db_user is None:
+    if row is None:
         raise HTTPException(status_code=404, detail="User not found")
 
+    db_user, department_name = row
+
     # Проверяем существование департамента, если он указан
     if user.department_id is not None:
         department_query = select(Department).where(Department.id == user.department_id)
         department_result = await db.execute(department_query)
         department = department_result.scalars().first()
 
-        if not department and user.department_id is not None:
+        if not department:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Department with id {user.department_id} not found"
             )
+        department_name = department.name
+    elif "department_id" in user.model_fields_set:
+        # department_id явно сброшен в null - пользователь больше не в департаменте
+        department_name = None
 
     # Обновляем поля пользователя
     update_data = user.model_dump(exclude_unset=True)
@@ -1275,20 +1205,11 @@ async def update_user(
 
     db.add(db_user)
     await db.commit()
-    await db.refresh(db_user)
+    user_cache.invalidate(db_user)
+    organization_structure_cache.invalidate()
 
-    # Создаем ответ с информацией о департаменте
-    user_dict = UserInDB.model_validate(user).model_dump()
-
-    if db_user.department_id:
-        department_query = select(Department).where(Department.id == db_user.department_id)
-        department_result = await db.execute(department_query)
-        department = department_result.scalars().first()
-
-        if department:
-            user_dict["department_name"] = department.name
-
-    return UserResponse(**user_dict)
+    # Сессия не сбрасывает атрибуты после commit, поэтому ответ строится без повторного запроса
+    return build_user_response(db_user, department_name)
 
 
 @app.delete("/api/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -1298,9 +1219,7 @@ async def delete_user(
         db: AsyncSession = Depends(get_async_session)
 ):
     # Проверяем существование пользователя
-    user_query = select(User).where(User.id == user_id)
-    result = await db.execute(user_query)
-    db_user = result.scalars().first()
+    db_user = await get_user_by_id(user_id, db)
 
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
@@ -1312,12 +1231,10 @@ async def delete_user(
             detail="Users cannot delete their own accounts"
         )
 
-    # Проверяем, есть ли документы, связанные с пользователем
-    documents_query = select(Document).where(Document.owner_id == user_id)
-    documents_result = await db.execute(documents_query)
-    documents = documents_result.scalars().all()
+    # Проверяем, есть ли документы, связанные с пользователем (без загрузки самих документов)
+    has_documents = await db.scalar(select(exists().where(Document.owner_id == user_id)))
 
-    if documents:
+    if has_documents:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Cannot delete user with existing documents. Reassign or delete documents first."
@@ -1325,6 +1242,8 @@ async def delete_user(
 
     await db.delete(db_user)
     await db.commit()
+    user_cache.invalidate(db_user)
+    organization_structure_cache.invalidate()
     return None
 
 
@@ -1335,26 +1254,13 @@ async def get_user_by_email(
         current_user: User = Depends(get_current_active_user),
         db: AsyncSession = Depends(get_async_session)
 ):
-    user_query = select(User).where(User.org_email == email)
-    result = await db.execute(user_query)
-    user = result.scalars().first()
+    result = await db.execute(user_with_department_query().where(User.org_email == email))
+    row = result.first()
 
-    if user is None:
+    if row is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    # Создаем базовый ответ
-    user_dict = UserInDB.model_validate(user).model_dump()
-
-    # Добавляем имя департамента, если пользователь привязан к департаменту
-    if user.department_id:
-        department_query = select(Department).where(Department.id == user.department_id)
-        department_result = await db.execute(department_query)
-        department = department_result.scalars().first()
-
-        if department:
-            user_dict["department_name"] = department.name
-
-    return UserResponse(**user_dict)
+    return build_user_response(*row)
 
 
 # Поиск пользователя по EtudeID
@@ -1364,32 +1270,18 @@ async def get_user_by_etude_id(
         current_user: User = Depends(get_current_active_user),
         db: AsyncSession = Depends(get_async_session)
 ):
-    user_query = select(User).where(User.EtudeID == etude_id)
-    result = await db.execute(user_query)
-    user = result.scalars().first()
+    result = await db.execute(user_with_department_query().where(User.EtudeID == etude_id))
+    row = result.first()
 
-    if user is None:
+    if row is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    # Создаем базовый ответ
-    user_dict = UserInDB.model_validate(user).model_dump()
-
-    # Добавляем имя департамента, если пользователь привязан к департаменту
-    if user.department_id:
-        department_query = select(Department).where(Department.id == user.department_id)
-        department_result = await db.execute(department_query)
-        department = department_result.scalars().first()
-
-        if department:
-            user_dict["department_name"] = department.name
-
-    return UserResponse(**user_dict)
+    return build_user_response(*row)
 
 # CRUD для Document
 @app.post("/api/documents/", response_model=DocumentInDB, status_code=status.HTTP_201_CREATED)
 async def create_document(
         document: DocumentCreate,
-        background_tasks: BackgroundTasks,
         db: AsyncSession = Depends(get_async_session)
 ):
     db_document = Document(**document.model_dump())
@@ -1397,22 +1289,34 @@ async def create_document(
     await db.commit()
     await db.refresh(db_document)
 
-    # Запускаем фоновую задачу для автоматического согласования
-    background_tasks.add_task(auto_approve_document, db_document.id, db)
-
+    # Автоматическое согласование выполнит approval_scheduler по истечении AUTO_APPROVAL_TIME
     return db_document
 
 
 @app.get("/api/documents/", response_model=List[DocumentInDB])
-async def read_documents(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_async_session)):
-    documents = await db.execute(select(Document).offset(skip).limit(limit))
+async def read_documents(
+        response: Response,
+        after: Optional[int] = None,
+        limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+        format: str = Query("json", pattern="^(json|ndjson)$"),
+        db: AsyncSession = Depends(get_async_session)
+):
+    if format == "ndjson":
+        query = keyset_page(select(Document), Document.id, after, None)
+        return ndjson_response(query, lambda document: DocumentInDB.model_validate(
+            document, from_attributes=True).model_dump_json())
+
+    documents = await db.execute(keyset_page(select(Document), Document.id, after, limit))
     documents = documents.scalars().all()
+    set_next_cursor(response, documents, limit)
     return documents
 
 
 @app.get("/api/documents/{document_id}", response_model=DocumentResponse)
 async def read_document(document_id: int, db: AsyncSession = Depends(get_async_session)):
-    document = await db.execute(select(Document).filter(Document.id == document_id))
+    document = await db.execute(
+        select(Document).options(selectinload(Document.owner)).filter(Document.id == document_id)
+    )
     document = document.scalars().first()
     if document is None:
         raise HTTPException(status_code=404, detail="Document not found")
@@ -1465,9 +1369,74 @@ async def approve_document(document_id: int, db: AsyncSession = Depends(get_asyn
 
 # Дополнительный эндпоинт для получения документов, ожидающих согласования
 @app.get("/api/documents/pending/", response_model=List[DocumentInDB])
-async def read_pending_documents(db: AsyncSession = Depends(get_async_session)):
-    documents = await db.execute(select(Document).filter(Document.isApproval == False))
-    documents = documents.scalars().all()
+async def read_pending_documents(
+        response: Response,
+        after: Optional[int] = None,
+        limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+        db: AsyncSession = Depends(get_async_session)
+):
+    # Условие совпадает с частичным индексом ix_documents_pending_id
+    query = keyset_page(select(Document).where(not_(Document.isApproval)), Document.id, after, limit)
+    documents = (await db.execute(query)).scalars().all()
+    set_next_cursor(response, documents, limit)
+    return documents
+
+
+# Входящие согласующего: документы, в coordinating которых есть ключ approver_id
+@app.get("/api/documents/coordinating/{approver_id}/", response_model=List[DocumentInDB])
+async def read_approver_documents(
+        approver_id: str,
+        response: Response,
+        pending: Optional[bool] = None,
+        after: Optional[int] = None,
+        limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+        db: AsyncSession = Depends(get_async_session)
+):
+    # Оператор ? обслуживается GIN индексом ix_documents_coordinating
+    query = select(Document).where(Document.coordinating.has_key(approver_id))
+    if pending is not None:
+        query = query.where(Document.isApproval == (not pending))
+    documents = (await db.execute(keyset_page(query, Document.id, after, limit))).scalars().all()
+    set_next_cursor(response, documents, limit)
+    return documents
+
+
+def parse_search_value(value: str, value_type: str):
+    """Значение из строки запроса в JSON-тип поля: @> сравнивает с учетом типа ("5" не равно 5)"""
+    try:
+        if value_type == "number":
+            if value.lstrip("-").isdigit():
+                return int(value)
+            number = float(value)
+            if not math.isfinite(number):
+                # NaN и бесконечность не представимы в JSON
+                raise ValueError(value)
+            return number
+        if value_type == "boolean":
+            return {"true": True, "false": False}[value.lower()]
+    except (ValueError, KeyError):
+        raise HTTPException(status_code=422, detail=f"Invalid {value_type} value: {value}")
+    return value
+
+
+# Поиск документов по значению поля DocInfo; вложенные поля через точку (additional_info.CourseType)
+@app.get("/api/documents/search/", response_model=List[DocumentInDB])
+async def search_documents(
+        response: Response,
+        field: str = Query(..., pattern=r"^\w+(\.\w+)*$"),
+        value: str = Query(...),
+        value_type: str = Query("string", pattern="^(string|number|boolean)$"),
+        after: Optional[int] = None,
+        limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+        db: AsyncSession = Depends(get_async_session)
+):
+    # {"a": {"b": value}} для field="a.b": оператор @> обслуживается GIN индексом ix_documents_docinfo
+    criteria = parse_search_value(value, value_type)
+    for key in reversed(field.split(".")):
+        criteria = {key: criteria}
+    query = select(Document).where(Document.DocInfo.contains(criteria))
+    documents = (await db.execute(keyset_page(query, Document.id, after, limit))).scalars().all()
+    set_next_cursor(response, documents, limit)
     return documents
 
 
@@ -1499,9 +1468,8 @@ async def login_with_email(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    # Хешируем введенный пароль и сравниваем с сохраненным хешем
-    hashed_password = hashlib.sha256(login_data.password.encode()).hexdigest()
-    if user.hashed_password != hashed_password:
+    # Сравниваем введенный пароль с сохраненным хешем
+    if not await verify_user_password(db, user, login_data.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -1511,7 +1479,7 @@ async def login_with_email(
     # Создаем данные для токена
     token_data = {
         "sub": user.email,  # Используем email как идентификатор пользователя для совместимости
-        "user_id": user.id,
+        "user_id": str(user.id),
         "name": user.name,
         "surname": user.surname
     }
@@ -1520,37 +1488,16 @@ async def login_with_email(
     access_token = create_access_token(token_data)
     refresh_token_value = create_refresh_token(token_data)
 
-    # Получаем существующий client_id из базы данных
-    client_query = select(OAuthClient).order_by(OAuthClient.id).limit(1)
-    client_result = await db.execute(client_query)
-    client = client_result.scalars().first()
-
+    # Токены выдаются от имени первого зарегистрированного клиента
+    client = client_registry.first()
     if not client:
-        # Если клиентов нет, создаем нового клиента
-        client = OAuthClient(
-            client_id="etude_backend_client",
-            client_secret="etude_backend_secret",
-            name="Etude Backend",
-            redirect_uris="http://localhost:8080/api/auth/callback",
-            allowed_scopes="profile documents"
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="No OAuth clients registered"
         )
-        db.add(client)
-        await db.commit()
-        await db.refresh(client)
-
-    # Сохраняем refresh токен в базе данных с существующим client_id
-    db_refresh_token = RefreshToken(
-        token=refresh_token_value,
-        user_id=user.id,
-        email=user.email,
-        scopes="profile documents",
-        client_id=client.client_id,  # Используем client_id из существующего клиента
-        expires_at=datetime.utcnow() + timedelta(days=30),
-        created_at=datetime.utcnow(),
-        revoked=False
-    )
 
-    db.add(db_refresh_token)
+    # Сохраняем хэш refresh токена в базе данных с существующим client_id
+    db.add(new_refresh_token_row(refresh_token_value, user.email, "profile,documents", client.client_id, user.id))
     await db.commit()
 
     # Возвращаем токены
@@ -1562,76 +1509,92 @@ async def login_with_email(
     )
 
 
+# Кэш структуры организации: меняется несколько раз в день, а запрашивается постоянно.
+# Воркер, выполнивший изменение, сбрасывает кэш сразу, остальные - по уведомлению от триггеров
+# на companies, departments и users. Время жизни задается в lifespan
+organization_structure_cache = JsonResponseCache()
+ORGANIZATION_CHANNEL = "organization_changed"
+
+
+def employee_info(user_row, department_name: str):
+    return {
+        "id": user_row.id,
+        "name": " ".join(filter(None, (user_row.surname, user_row.name, user_row.patronymic))),
+        "position": user_row.position,
+        "email": user_row.org_email,
+        "is_leader": user_row.is_leader,
+        "department_name": department_name
+    }
+
+
+async def build_organization_structure(db: AsyncSession):
+    """Строит структуру первой по имени компании одним упорядоченным запросом"""
+    company_id = select(Company.id).order_by(Company.name).limit(1).scalar_subquery()
+    query = (
+        select(
+            Company.name.label("company_name"), Department.id.label("department_id"),
+            Department.name.label("department_name"), User.id, User.surname, User.name, User.patronymic,
+            User.position, User.org_email, User.is_leader
+        )
+        .outerjoin(Department, Department.company_id == Company.id)
+        .outerjoin(User, User.department_id == Department.id)
+        .where(Company.id == company_id)
+        # Руководитель идет первым в своем департаменте, затем сотрудники по фамилии и имени
+        .order_by(Department.name, Department.id, User.is_leader.desc(), User.surname, User.name)
+    )
+    rows = (await db.execute(query)).all()
+
+    if not rows:
+        return None
+
+    structure = {"company": {"name": rows[0].company_name, "departments": []}}
+    departments = structure["company"]["departments"]
+    current_department_id = None
+    department = None
+
+    for row in rows:
+        if row.department_id is None or row.id is None:
+            continue
+
+        if row.department_id != current_department_id:
+            current_department_id = row.department_id
+            # Департаменты без руководителя не попадают в структуру
+            if not row.is_leader:
+                department = None
+                continue
+            department = {
+                "name": row.department_name,
+                "manager": employee_info(row, row.department_name),
+                "employees": []
+            }
+            departments.append(department)
+        elif department is not None and not row.is_leader:
+            department["employees"].append(employee_info(row, row.department_name))
+
+    return structure
+
+
 @app.get("/api/organization/structure", response_model=OrganizationStructure)
 async def get_organization_structure(
+        if_none_match: Optional[str] = Header(None),
         db: AsyncSession = Depends(get_async_session)
 ):
-    # Получаем компанию
-    company_query = select(Company).order_by(Company.name)
-    company_result = await db.execute(company_query)
-    company = company_result.scalars().first()
-
-    if not company:
-        raise HTTPException(status_code=404, detail="Компания не найдена")
-
-    # Создаем структуру ответа
-    structure = {"company": {"name": company.name, "departments": []}}
-
-    # Получаем все департаменты
-    departments_query = select(Department).where(Department.company_id == company.id).order_by(Department.name)
-    departments_result = await db.execute(departments_query)
-    departments = departments_result.scalars().all()
-
-    # Для каждого департамента
-    for department in departments:
-        # Получаем руководителя (is_leader = True)
-        manager_query = select(User).where(
-            (User.department_id == department.id) &
-            (User.is_leader == True)
-        )
-        manager_result = await db.execute(manager_query)
-        manager = manager_result.scalars().first()
+    cached = organization_structure_cache.get()
 
-        if not manager:
-            # Если руководитель не найден, пропускаем департамент
-            continue
+    if cached is None:
+        version = organization_structure_cache.version
+        structure = await build_organization_structure(db)
 
-        # Получаем всех сотрудников департамента, кроме руководителя
-        employees_query = select(User).where(
-            (User.department_id == department.id) &
-            (User.is_leader == False)
-        ).order_by(User.surname, User.name)
-        employees_result = await db.execute(employees_query)
-        employees = employees_result.scalars().all()
-
-        # Создаем объект департамента
-        dept_structure = {
-            "name": department.name,
-            "manager": {
-                "id": manager.id,
-                "name": f"{manager.surname} {manager.name} {manager.patronymic if manager.patronymic else ''}".strip(),
-                "position": manager.position,
-                "email": manager.org_email,
-                "is_leader": True,
-                "department_name": department.name
-            },
-            "employees": []
-        }
+        if structure is None:
+            raise HTTPException(status_code=404, detail="Компания не найдена")
 
-        # Добавляем сотрудников
-        for employee in employees:
-            dept_structure["employees"].append({
-                "id": employee.id,
-                "name": f"{employee.surname} {employee.name} {employee.patronymic if employee.patronymic else ''}".strip(),
-                "position": employee.position,
-                "email": employee.org_email,
-                "is_leader": False,
-                "department_name": department.name
-            })
+        cached = organization_structure_cache.store(structure, version)
 
-        structure["company"]["departments"].append(dept_structure)
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, cached.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
-    return structure
+    return Response(content=cached.body, media_type="application/json", headers=headers)
 
 
 if __name__ == "__main__":
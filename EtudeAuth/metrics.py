@@ -0,0 +1,429 @@
+import asyncio
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"}
+
+
+class Metric:
+    """Метрика с набором меток; значения хранятся в словаре кортеж меток -> значение"""
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def samples(self) -> list:
+        return [[list(labels), value] for labels, value in self._values.items()]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, *labels, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels):
+        self._values[labels] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        entry = self._values.get(labels)
+        if entry is None:
+            # [число попаданий в каждый интервал (не накопительно), сумма, количество]
+            entry = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            entry[0][index] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def samples(self) -> list:
+        return [
+            [list(labels), [list(counts), total, count]]
+            for labels, (counts, total, count) in self._values.items()
+        ]
+
+
+class CallbackMetric(Metric):
+    """Значения вычисляются в момент сбора (счетчики кэшей, состояние пула)"""
+
+    def __init__(self, name: str, documentation: str, metric_type: str, labelnames: Sequence[str],
+                 collect: Callable[[], Dict[tuple, float]]):
+        super().__init__(name, documentation, labelnames)
+        self.type = metric_type
+        self._collect = collect
+
+    def samples(self) -> list:
+        return [[list(labels), value] for labels, value in self._collect().items()]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, metric_type: str, labelnames: Sequence[str],
+                 collect: Callable[[], Dict[tuple, float]]) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, metric_type, labelnames, collect))
+
+    def snapshot(self) -> dict:
+        """Сериализуемое состояние всех метрик процесса"""
+        return {
+            metric.name: {
+                "type": metric.type,
+                "help": metric.documentation,
+                "labelnames": list(metric.labelnames),
+                "buckets": list(getattr(metric, "buckets", ())),
+                "samples": metric.samples(),
+            }
+            for metric in self._metrics.values()
+        }
+
+
+def merge_snapshots(snapshots: List[dict]) -> dict:
+    """Складывает снимки воркеров: счетчики, гистограммы и gauge суммируются"""
+    merged = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(name, dict(metric, samples={}))
+            for labels, value in metric["samples"]:
+                key = tuple(labels)
+                current = target["samples"].get(key)
+                if metric["type"] == "histogram":
+                    if current is None:
+                        target["samples"][key] = [list(value[0]), value[1], value[2]]
+                    elif len(current[0]) == len(value[0]):
+                        current[0] = [a + b for a, b in zip(current[0], value[0])]
+                        current[1] += value[1]
+                        current[2] += value[2]
+                else:
+                    target["samples"][key] = (current or 0.0) + value
+    return merged
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra: Optional[tuple] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def render(merged: dict) -> str:
+    """Текстовый формат экспозиции Prometheus"""
+    lines = []
+    for name, metric in merged.items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        labelnames = metric["labelnames"]
+        for labels, value in metric["samples"].items():
+            if metric["type"] == "histogram":
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(metric["buckets"], counts):
+                    cumulative += bucket_count
+                    bucket_labels = _format_labels(labelnames, labels, ("le", _format_value(bound)))
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labelnames, labels, ('le', '+Inf'))} {count}")
+                lines.append(f"{name}_sum{_format_labels(labelnames, labels)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(labelnames, labels)} {count}")
+            else:
+                lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def to_snapshot(merged: dict) -> dict:
+    """Результат merge_snapshots обратно в формат снимка (для записи в файл)"""
+    return {
+        name: dict(metric, samples=[[list(labels), value] for labels, value in metric["samples"].items()])
+        for name, metric in merged.items()
+    }
+
+
+def cumulative_only(snapshot: dict) -> dict:
+    """Счетчики и гистограммы снимка: gauge завершившегося процесса больше ничего не значат"""
+    return {name: metric for name, metric in snapshot.items() if metric["type"] in ("counter", "histogram")}
+
+
+class MetricsExporter:
+    """Сбор метрик со всех воркеров gunicorn.
+
+    Каждый воркер периодически записывает снимок своих метрик в общий каталог
+    (файл <pid>.json). Воркер, обслуживающий /metrics, складывает свое текущее
+    состояние со снимками остальных живых воркеров. Без каталога отдаются
+    метрики только текущего процесса.
+
+    Счетчики и гистограммы завершившихся воркеров переносятся в накопительный файл,
+    чтобы суммы не уменьшались при перезапуске воркеров (иначе rate() видит сброс
+    счетчика); их gauge отбрасываются. Перенос и чтение выполняются под блокировкой
+    файла, поэтому каждый снимок учитывается ровно один раз.
+    """
+
+    ACCUMULATED_FILE = "accumulated.json"
+    LOCK_FILE = "metrics.lock"
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+        self.directory: Optional[str] = None
+        self.interval: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"{pid}.json")
+
+    @staticmethod
+    def _write(path: str, snapshot: dict):
+        with open(path + ".tmp", "w") as f:
+            json.dump(snapshot, f)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def _read(path: str) -> Optional[dict]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @contextlib.contextmanager
+    def _locked(self):
+        # fcntl есть только в Unix; каталог метрик используется только с gunicorn
+        import fcntl
+
+        with open(os.path.join(self.directory, self.LOCK_FILE), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _accumulate(self, snapshot: dict):
+        """Добавляет счетчики завершившегося воркера в накопительный файл (под блокировкой)"""
+        path = os.path.join(self.directory, self.ACCUMULATED_FILE)
+        accumulated = self._read(path) or {}
+        self._write(path, to_snapshot(merge_snapshots([accumulated, cumulative_only(snapshot)])))
+
+    def dump(self):
+        self._write(self._path(os.getpid()), self.registry.snapshot())
+
+    @staticmethod
+    def _is_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _other_snapshots(self) -> List[dict]:
+        """Снимки остальных воркеров и накопленные счетчики завершившихся (под блокировкой)"""
+        snapshots = []
+        for file_name in os.listdir(self.directory):
+            stem, extension = os.path.splitext(file_name)
+            if extension != ".json" or not stem.isdigit() or int(stem) == os.getpid():
+                continue
+            path = os.path.join(self.directory, file_name)
+            snapshot = self._read(path)
+            if not self._is_alive(int(stem)):
+                # Воркер завершился - его счетчики переходят в накопительный файл
+                if snapshot is not None:
+                    self._accumulate(snapshot)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            if snapshot is not None:
+                snapshots.append(snapshot)
+
+        accumulated = self._read(os.path.join(self.directory, self.ACCUMULATED_FILE))
+        if accumulated:
+            snapshots.append(accumulated)
+        return snapshots
+
+    def collect(self) -> str:
+        snapshots = [self.registry.snapshot()]
+        if self.directory:
+            with self._locked():
+                snapshots.extend(self._other_snapshots())
+        return render(merge_snapshots(snapshots))
+
+    async def _run(self):
+        while True:
+            try:
+                self.dump()
+            except Exception:
+                logger.exception("Metrics dump failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self, directory: Optional[str], interval: float):
+        self.directory = directory
+        self.interval = interval
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+            # Итоговые счетчики воркера сохраняются в накопительном файле
+            try:
+                with self._locked():
+                    self._accumulate(self.registry.snapshot())
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(self._path(os.getpid()))
+            except OSError:
+                logger.exception("Metrics final dump failed")
+
+
+registry = MetricsRegistry()
+
+HTTP_REQUESTS_IN_FLIGHT = registry.gauge(
+    "etude_http_requests_in_flight", "HTTP requests currently being processed", ("method",))
+HTTP_REQUEST_DURATION = registry.histogram(
+    "etude_http_request_duration_seconds", "HTTP request latency by route template",
+    ("method", "route", "status"))
+HTTP_REQUEST_DB_QUERIES = registry.histogram(
+    "etude_http_request_db_queries", "Database queries per HTTP request", ("route",), QUERY_COUNT_BUCKETS)
+HTTP_REQUEST_DB_DURATION = registry.histogram(
+    "etude_http_request_db_duration_seconds", "Total database time per HTTP request", ("route",))
+DB_QUERY_DURATION = registry.histogram(
+    "etude_db_query_duration_seconds", "Database query latency by statement type", ("operation",), FAST_BUCKETS)
+DB_POOL_CHECKOUT_WAIT = registry.histogram(
+    "etude_db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection", (), FAST_BUCKETS)
+JWT_DURATION = registry.histogram(
+    "etude_jwt_duration_seconds", "JWT encode and decode latency", ("operation",), FAST_BUCKETS)
+
+
+class RequestDbStats:
+    """Запросы к БД в рамках одного HTTP-запроса"""
+    __slots__ = ("queries", "duration")
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+
+
+# Контекст передается в greenlet, в котором SQLAlchemy выполняет запросы
+current_request_db: contextvars.ContextVar = contextvars.ContextVar("current_request_db", default=None)
+
+
+def statement_operation(statement: str) -> str:
+    # По первому слову: срез из шести символов для WITH захватывал и следующий за ним символ
+    words = statement.split(None, 1)
+    operation = words[0].upper() if words else ""
+    return operation if operation in SQL_OPERATIONS else "OTHER"
+
+
+def instrument_engine(engine):
+    """Замеряет каждый запрос движка и учитывает его в статистике текущего HTTP-запроса"""
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started_at"].pop()
+        DB_QUERY_DURATION.observe(elapsed, statement_operation(statement))
+        stats = current_request_db.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.duration += elapsed
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get("query_started_at"):
+            context.connection.info["query_started_at"].pop()
+
+
+class MetricsMiddleware:
+    """ASGI middleware: задержка по шаблону маршрута, запросы в обработке и запросы к БД"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        method = scope["method"]
+        stats = RequestDbStats()
+        token = current_request_db.set(stats)
+        HTTP_REQUESTS_IN_FLIGHT.inc(method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_REQUESTS_IN_FLIGHT.dec(method)
+            current_request_db.reset(token)
+            # Шаблон маршрута вместо пути: /api/users/{user_id}, а не каждый id отдельно
+            route = getattr(scope.get("route"), "path", "other")
+            HTTP_REQUEST_DURATION.observe(elapsed, method, route, str(status_code))
+            HTTP_REQUEST_DB_QUERIES.observe(stats.queries, route)
+            HTTP_REQUEST_DB_DURATION.observe(stats.duration, route)
@@ -0,0 +1,27 @@
+"""auth_tokens_code_unique
+
+Revision ID: 6aef29295e63
+Revises: ab75299dc137
+Create Date: 2025-06-05 15:47:03.114572
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6aef29295e63'
+down_revision: Union[str, None] = 'ab75299dc137'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Раньше коды не удалялись после обмена - убираем накопившиеся истекшие
+    op.execute("DELETE FROM auth_tokens WHERE expires_at <= (now() AT TIME ZONE 'utc')")
+    op.create_index(op.f('ix_auth_tokens_code'), 'auth_tokens', ['code'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_auth_tokens_code'), table_name='auth_tokens')
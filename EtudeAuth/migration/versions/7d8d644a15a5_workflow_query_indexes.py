@@ -0,0 +1,32 @@
+"""workflow_query_indexes
+
+Revision ID: 7d8d644a15a5
+Revises: e7a35d6499d7
+Create Date: 2025-06-06 15:02:11.384520
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d8d644a15a5'
+down_revision: Union[str, None] = 'e7a35d6499d7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_documents_pending_id', 'documents', ['id'], unique=False,
+                    postgresql_where=sa.text('NOT "isApproval"'))
+    op.create_index('ix_documents_owner_id_id', 'documents', ['owner_id', 'id'], unique=False)
+    op.create_index('ix_users_department_id_id', 'users', ['department_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_department_id_id', table_name='users')
+    op.drop_index('ix_documents_owner_id_id', table_name='documents')
+    op.drop_index('ix_documents_pending_id', table_name='documents',
+                  postgresql_where=sa.text('NOT "isApproval"'))
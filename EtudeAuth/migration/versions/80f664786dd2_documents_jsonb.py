@@ -0,0 +1,40 @@
+"""documents_jsonb
+
+Revision ID: 80f664786dd2
+Revises: 7d8d644a15a5
+Create Date: 2025-06-07 11:47:05.219306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '80f664786dd2'
+down_revision: Union[str, None] = '7d8d644a15a5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Смена типа переписывает таблицу documents под эксклюзивной блокировкой
+    op.alter_column('documents', 'coordinating', type_=postgresql.JSONB(), existing_type=sa.JSON(),
+                    postgresql_using='coordinating::jsonb')
+    op.alter_column('documents', 'DocInfo', type_=postgresql.JSONB(), existing_type=sa.JSON(),
+                    postgresql_using='"DocInfo"::jsonb')
+    op.create_index('ix_documents_coordinating', 'documents', ['coordinating'], unique=False,
+                    postgresql_using='gin')
+    op.create_index('ix_documents_docinfo', 'documents', ['DocInfo'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'DocInfo': 'jsonb_path_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_documents_docinfo', table_name='documents', postgresql_using='gin')
+    op.drop_index('ix_documents_coordinating', table_name='documents', postgresql_using='gin')
+    op.alter_column('documents', 'DocInfo', type_=sa.JSON(), existing_type=postgresql.JSONB(),
+                    postgresql_using='"DocInfo"::json')
+    op.alter_column('documents', 'coordinating', type_=sa.JSON(), existing_type=postgresql.JSONB(),
+                    postgresql_using='coordinating::json')
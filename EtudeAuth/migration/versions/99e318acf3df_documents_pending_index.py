@@ -0,0 +1,28 @@
+"""documents_pending_index
+
+Revision ID: 99e318acf3df
+Revises: 1891dac8e509
+Create Date: 2025-06-04 16:38:51.209114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '99e318acf3df'
+down_revision: Union[str, None] = '1891dac8e509'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_documents_pending_created_at', 'documents', ['created_at'], unique=False,
+                    postgresql_where=sa.text('NOT "isApproval"'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_documents_pending_created_at', table_name='documents',
+                  postgresql_where=sa.text('NOT "isApproval"'))
@@ -0,0 +1,39 @@
+"""oauth_clients_notify
+
+Revision ID: ab75299dc137
+Revises: 99e318acf3df
+Create Date: 2025-06-05 11:12:40.518306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ab75299dc137'
+down_revision: Union[str, None] = '99e318acf3df'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Воркеры обновляют реестр клиентов по уведомлению в канал oauth_clients_changed
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_oauth_clients_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('oauth_clients_changed', '');
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER oauth_clients_changed
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON oauth_clients
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_oauth_clients_changed()
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS oauth_clients_changed ON oauth_clients")
+    op.execute("DROP FUNCTION IF EXISTS notify_oauth_clients_changed()")
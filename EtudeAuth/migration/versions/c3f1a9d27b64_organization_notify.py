@@ -0,0 +1,49 @@
+"""organization_notify
+
+Revision ID: c3f1a9d27b64
+Revises: 80f664786dd2
+Create Date: 2025-06-08 10:21:37.604112
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3f1a9d27b64'
+down_revision: Union[str, None] = '80f664786dd2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Столбцы, из которых строится структура организации: смена пароля при входе уведомление не вызывает
+TRIGGERS = {
+    'companies': 'INSERT OR DELETE OR TRUNCATE OR UPDATE OF name',
+    'departments': 'INSERT OR DELETE OR TRUNCATE OR UPDATE OF name, company_id',
+    'users': 'INSERT OR DELETE OR TRUNCATE OR UPDATE OF surname, name, patronymic, position, org_email, '
+             'is_leader, department_id',
+}
+
+
+def upgrade() -> None:
+    # Воркеры сбрасывают кэш структуры организации по уведомлению в канал organization_changed
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_organization_changed() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('organization_changed', '');
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for table, events in TRIGGERS.items():
+        op.execute(f"""
+            CREATE TRIGGER {table}_organization_changed
+            AFTER {events} ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_organization_changed()
+        """)
+
+
+def downgrade() -> None:
+    for table in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_organization_changed ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS notify_organization_changed()")
@@ -0,0 +1,46 @@
+"""refresh_tokens_hash
+
+Revision ID: e7a35d6499d7
+Revises: 6aef29295e63
+Create Date: 2025-06-06 10:21:37.640918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a35d6499d7'
+down_revision: Union[str, None] = '6aef29295e63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('refresh_tokens', sa.Column('token_hash', sa.LargeBinary(length=32), nullable=True))
+    # Хэшируем уже выданные токены, чтобы они продолжили работать
+    op.execute("UPDATE refresh_tokens SET token_hash = sha256(convert_to(token, 'UTF8')) WHERE token IS NOT NULL")
+    op.execute("DELETE FROM refresh_tokens WHERE token_hash IS NULL")
+    # Раньше срок действия не заполнялся при выдаче через /oauth/token
+    op.execute("UPDATE refresh_tokens SET expires_at = COALESCE(created_at, now() AT TIME ZONE 'utc') "
+               "+ interval '30 days' WHERE expires_at IS NULL")
+    op.alter_column('refresh_tokens', 'token_hash', nullable=False)
+
+    op.drop_index(op.f('ix_refresh_tokens_token'), table_name='refresh_tokens')
+    op.drop_column('refresh_tokens', 'token')
+    op.create_index('ix_refresh_tokens_active_token_hash', 'refresh_tokens', ['token_hash'], unique=True,
+                    postgresql_where=sa.text('NOT revoked'))
+    op.create_index(op.f('ix_refresh_tokens_expires_at'), 'refresh_tokens', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    # Исходные токены по хэшу не восстановить - пользователям придется войти заново
+    op.drop_index(op.f('ix_refresh_tokens_expires_at'), table_name='refresh_tokens')
+    op.drop_index('ix_refresh_tokens_active_token_hash', table_name='refresh_tokens',
+                  postgresql_where=sa.text('NOT revoked'))
+    op.execute("DELETE FROM refresh_tokens")
+    op.drop_column('refresh_tokens', 'token_hash')
+    op.add_column('refresh_tokens', sa.Column('token', sa.String(), nullable=True))
+    op.create_index(op.f('ix_refresh_tokens_token'), 'refresh_tokens', ['token'], unique=True)
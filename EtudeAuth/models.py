@@ -15,7 +15,7 @@ class UserBase(BaseModel):
 
 class UserCreate(UserBase):
     password: str
-    department_id: Optional[int] = None
+    department_id: Optional[uuid.UUID] = None
     EtudeID: Optional[int] = None
 
 
@@ -24,7 +24,7 @@ class UserUpdate(BaseModel):
     surname: Optional[str] = None
     patronymic: Optional[str] = None
     position: Optional[str] = None
-    department_id: Optional[int] = None
+    department_id: Optional[uuid.UUID] = None
     EtudeID: Optional[int] = None
 
 
@@ -54,7 +54,7 @@ class CompanyUpdate(BaseModel):
 
 
 class CompanyInDB(CompanyBase):
-    id: int
+    id: uuid.UUID
 
     class Config:
         orm_mode = True
@@ -66,7 +66,7 @@ class CompanyWithDepartments(CompanyInDB):
 
 class DepartmentBase(BaseModel):
     name: str
-    company_id: int
+    company_id: uuid.UUID
 
 class DepartmentCreate(DepartmentBase):
     pass
@@ -74,11 +74,11 @@ class DepartmentCreate(DepartmentBase):
 
 class DepartmentUpdate(BaseModel):
     name: Optional[str] = None
-    company_id: Optional[int] = None
+    company_id: Optional[uuid.UUID] = None
 
 
 class DepartmentInDB(DepartmentBase):
-    id: int
+    id: uuid.UUID
 
     class Config:
         orm_mode = True
@@ -111,6 +111,21 @@ class EmailLoginRequest(BaseModel):
     email: str
     password: str
 
+class TokenValidationItem(BaseModel):
+    token: str
+    required_scopes: Optional[List[str]] = None
+
+class ValidatedUser(BaseModel):
+    email: str
+    full_name: str
+
+class TokenValidationResult(BaseModel):
+    valid: bool
+    reason: Optional[str] = None
+    user: Optional[ValidatedUser] = None
+    scopes: List[str] = []
+    expires_at: Optional[float] = None
+
 class TokenRequest(BaseModel):
     grant_type: str
     client_id: str
@@ -127,7 +142,7 @@ class DocumentBase(BaseModel):
 
 
 class DocumentCreate(DocumentBase):
-    owner_id: int
+    owner_id: uuid.UUID
 
 
 class DocumentUpdate(BaseModel):
@@ -137,10 +152,11 @@ class DocumentUpdate(BaseModel):
 
 
 class DocumentInDB(DocumentBase):
+    EtudeDocID: Optional[str] = None  # Нет у документов, созданных через /api/user/me/documents
     id: int
     isApproval: bool
     created_at: datetime
-    owner_id: int
+    owner_id: uuid.UUID
 
     class Config:
         orm_mode = True
@@ -149,6 +165,20 @@ class DocumentInDB(DocumentBase):
 class DocumentResponse(DocumentInDB):
     owner: UserInDB
 
+
+class DocumentSummary(BaseModel):
+    """Документ владельца токена: только выбранные столбцы и поля DocInfo"""
+    id: int
+    EtudeDocID: Optional[str] = None
+    title: Optional[str] = None
+    type: Optional[str] = None
+    isApproval: bool
+    created_at: datetime
+
+
+class DocumentDetail(DocumentSummary):
+    description: Optional[str] = None
+
 class AuthToken(BaseModel):
     code: str
     email: str
@@ -0,0 +1,73 @@
+import asyncio
+import inspect
+import logging
+from typing import Callable, Dict, List, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+RETRY_DELAY = 5.0
+
+
+class NotificationListener:
+    """Одно соединение LISTEN на воркер для всех каналов NOTIFY.
+
+    Обработчики канала вызываются на каждое уведомление, а также после каждого
+    (пере)подключения: уведомления, отправленные без подписки, теряются.
+    Через PgBouncer в transaction-режиме LISTEN не работает - тогда слушатель не запускают,
+    а подписчики полагаются на периодическое обновление или время жизни кэша.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Callable]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, channel: str, handler: Callable):
+        """handler - функция без аргументов, обычная или async"""
+        self._handlers.setdefault(channel, []).append(handler)
+
+    async def _notify(self, channel: str):
+        for handler in self._handlers.get(channel, ()):
+            try:
+                result = handler()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.exception("Notification handler failed", extra={"channel": channel})
+
+    async def _run(self):
+        # Драйвер нужен только слушателю; при импорте модуля его не загружаем
+        import psycopg
+
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                        host=settings.DB_HOST, port=settings.DB_PORT, dbname=settings.DB_NAME,
+                        user=settings.DB_USER, password=settings.DB_PASS, autocommit=True
+                ) as conn:
+                    for channel in self._handlers:
+                        await conn.execute(f"LISTEN {channel}")
+                    # Изменения, сделанные до подписки, могли быть пропущены
+                    for channel in self._handlers:
+                        await self._notify(channel)
+                    async for notify in conn.notifies():
+                        await self._notify(notify.channel)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Notification listener failed")
+            await asyncio.sleep(RETRY_DELAY)
+
+    def start(self):
+        if self._handlers:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self._handlers = {}
+
+
+notification_listener = NotificationListener()
@@ -3,10 +3,16 @@ from fastapi import HTTPException, status
 import jwt
 from pydantic import BaseModel
 from typing import Optional, List
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import time
+from functools import lru_cache
 import uuid
 from config import settings
 from fastapi.security import SecurityScopes
+from revocation import revocation_store
+from token_cache import TokenCache
+from keys import KeyRing
+from metrics import JWT_DURATION
 
 # Модели данных
 class TokenData(BaseModel):
@@ -25,8 +31,24 @@ class Token(BaseModel):
     scope: Optional[str] = None
 
 
-# Токены, которые были отозваны (в продакшн должны храниться в Redis/БД)
-REVOKED_TOKENS = set()
+# Кэш проверенных access токенов (локальный для воркера); размер задается в lifespan
+token_cache = TokenCache()
+
+
+@lru_cache
+def get_key_ring() -> Optional[KeyRing]:
+    """Ключи асимметричной подписи загружаются один раз на процесс (None - подпись HS256 общим секретом)"""
+    return KeyRing.load(settings.JWT_KEYS_DIR, settings.JWT_ACTIVE_KID) if settings.JWT_KEYS_DIR else None
+
+
+def hs256_accepted() -> bool:
+    """Принимаются ли токены без kid при настроенных ключах (выданные до перехода, не дольше JWT_HS256_ACCEPT_UNTIL)"""
+    accept_until = settings.JWT_HS256_ACCEPT_UNTIL
+    if accept_until is None:
+        return False
+    if accept_until.tzinfo is not None:
+        accept_until = accept_until.astimezone(timezone.utc).replace(tzinfo=None)
+    return datetime.utcnow() < accept_until
 
 
 def create_jwt_token(data: dict, expires_delta: Optional[timedelta] = None, token_type: str = "access"):
@@ -47,10 +69,17 @@ def create_jwt_token(data: dict, expires_delta: Optional[timedelta] = None, toke
         "type": token_type
     })
 
-    # Выбираем секретный ключ в зависимости от типа токена
-    secret_key = settings.SECRET
-
-    return jwt.encode(to_encode, secret_key, algorithm="HS256")
+    started = time.perf_counter()
+    # Подписываем активным ключом (kid в заголовке позволяет проверять токены после ротации)
+    key_ring = get_key_ring()
+    if key_ring:
+        signing_key = key_ring.active
+        token = jwt.encode(to_encode, signing_key.private_key, algorithm=signing_key.algorithm,
+                           headers={"kid": signing_key.kid})
+    else:
+        token = jwt.encode(to_encode, settings.SECRET, algorithm="HS256")
+    JWT_DURATION.observe(time.perf_counter() - started, "encode")
+    return token
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -63,22 +92,34 @@ def create_refresh_token(data: dict):
     return create_jwt_token(data, None, "refresh")
 
 
-def decode_token(token: str):
+async def decode_token(token: str):
     """Декодирует JWT токен и проверяет его на валидность"""
+    started = time.perf_counter()
     try:
-        payload = jwt.decode(token, settings.SECRET, algorithms=["HS256"])
-        # Проверяем, не был ли токен отозван
-        if payload.get("jti") in REVOKED_TOKENS:
+        # Токены с kid проверяем открытым ключом, остальные - общим секретом
+        key_ring = get_key_ring()
+        signing_key = key_ring.get(jwt.get_unverified_header(token).get("kid")) if key_ring else None
+        if signing_key:
+            payload = jwt.decode(token, signing_key.public_key, algorithms=[signing_key.algorithm])
+        elif key_ring is None or hs256_accepted():
+            payload = jwt.decode(token, settings.SECRET, algorithms=["HS256"])
+        else:
             return None
-
-        return payload
     except:
         return None
+    finally:
+        JWT_DURATION.observe(time.perf_counter() - started, "decode")
 
+    # Проверяем, не был ли токен отозван (bloom-фильтр отсекает почти все токены без запроса к БД)
+    if await revocation_store.is_revoked(payload.get("jti")):
+        return None
 
-def validate_token(token: str, required_scopes: SecurityScopes = None):
-    """Проверяет валидность токена и наличие необходимых scope"""
-    payload = decode_token(token)
+    return payload
+
+
+async def _verify_access_token(token: str):
+    """Полная проверка access токена: подпись, отзыв, тип и срок действия"""
+    payload = await decode_token(token)
     if not payload:
         return None
 
@@ -95,27 +136,42 @@ def validate_token(token: str, required_scopes: SecurityScopes = None):
     if not email:
         return None
 
-    scopes = payload.get("scopes", [])
-
-    # Проверяем наличие необходимых scopes
-    if required_scopes:
-        for scope in required_scopes.scopes:
-            if scope not in scopes:
-                return None
-
     return TokenData(
         sub=email,
-        scopes=scopes,
+        scopes=payload.get("scopes", []),
         client_id=payload.get("client_id"),
         exp=datetime.fromtimestamp(payload.get("exp")),
         jti=payload.get("jti")
-    )
+    ), payload.get("exp")
+
+
+async def validate_token(token: str, required_scopes: SecurityScopes = None):
+    """Проверяет валидность токена и наличие необходимых scope"""
+    key = token_cache.key(token)
+    token_data = token_cache.get(key)
+
+    # Токен из кэша мог быть отозван на другом воркере - в этом случае проверяем его заново
+    if token_data is None or revocation_store.might_be_revoked(token_data.jti):
+        verified = await _verify_access_token(token)
+        if not verified:
+            return None
+        token_data, expires_at = verified
+        token_cache.put(key, token_data, expires_at)
+
+    # Проверяем наличие необходимых scopes (принимаем как SecurityScopes, так и список)
+    if required_scopes:
+        for scope in getattr(required_scopes, "scopes", required_scopes):
+            if scope not in token_data.scopes:
+                return None
+
+    return token_data
 
 
-def revoke_token(token: str):
-    """Отзывает токен, добавляя его в список отозванных"""
-    payload = decode_token(token)
+async def revoke_token(token: str):
+    """Отзывает токен, добавляя его в хранилище отозванных до истечения срока действия"""
+    payload = await decode_token(token)
     if payload and payload.get("jti"):
-        REVOKED_TOKENS.add(payload.get("jti"))
+        await revocation_store.revoke(payload.get("jti"), datetime.utcfromtimestamp(payload.get("exp")))
+        token_cache.invalidate(token)
         return True
-    return False
\ No newline at end of file
+    return False
@@ -1,241 +1,338 @@
 # organization_seed.py
-import json
-import uuid
+"""Генератор синтетической организационной структуры.
+
+Без аргументов создает organization_data.json как раньше: одна компания, 10 отделов по 10 сотрудников.
+Для нагрузочных тестов размер задается параметрами, а записи пишутся в файл потоково пачками:
+
+    python organization_seed.py --companies 5 --departments 20 --depth 3 --branching 4 \\
+        --users-per-department 200 --format ndjson --output large.ndjson
+
+Форматы: json (структура для import_organization.py, только одна компания), ndjson (одна запись
+в строке с полем "type") и csv (каталог с companies.csv, departments.csv и users.csv для COPY).
+Результат полностью определяется --seed.
+"""
+import argparse
+import csv
 import hashlib
+import json
+import os
 import random
-from faker import Faker
-
-# Инициализируем Faker для генерации случайных данных
-fake_ru = Faker('ru_RU')  # Для русских имен и текста
-
-# Набор уже использованных email-адресов для проверки уникальности
-used_emails = set()
-
-
-# Функция для транслитерации русских имен для email
-def transliterate(name):
-    # Словарь для транслитерации
-    translit_dict = {
-        'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
-        'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
-        'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
-        'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '',
-        'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
-        'А': 'A', 'Б': 'B', 'В': 'V', 'Г': 'G', 'Д': 'D', 'Е': 'E', 'Ё': 'E',
-        'Ж': 'Zh', 'З': 'Z', 'И': 'I', 'Й': 'Y', 'К': 'K', 'Л': 'L', 'М': 'M',
-        'Н': 'N', 'О': 'O', 'П': 'P', 'Р': 'R', 'С': 'S', 'Т': 'T', 'У': 'U',
-        'Ф': 'F', 'Х': 'Kh', 'Ц': 'Ts', 'Ч': 'Ch', 'Ш': 'Sh', 'Щ': 'Sch', 'Ъ': '',
-        'Ы': 'Y', 'Ь': '', 'Э': 'E', 'Ю': 'Yu', 'Я': 'Ya'
-    }
-
-    result = ''
-    for char in name:
-        result += translit_dict.get(char, char)
-
-    return result
-
-
-# Функция для преобразования названия отдела в родительный падеж
-def department_to_genitive(name):
-    """Преобразует название отдела в родительный падеж"""
-    # Словарь окончаний и их форм в родительном падеже
-    replacements = {
-        "Отдел": "Отдела",
-        "Бухгалтерия": "Бухгалтерии",
-        "Администрация": "Администрации",
-        "Служба": "Службы",
-        "отдел": "отдела",
-        "бухгалтерия": "бухгалтерии",
-        "администрация": "администрации",
-        "служба": "службы"
-    }
-
-    # Обработка сложных названий
-    for word, genitive in replacements.items():
-        if name.endswith(word):
-            # Заменяем только окончание
-            prefix = name[:-len(word)]
-            return prefix + genitive
-
-    # Специальные случаи
-    special_cases = {
-        "ИТ Отдел": "ИТ Отдела",
-        "Отдел разработки": "Отдела разработки",
-        "Отдел продаж": "Отдела продаж",
-        "Отдел маркетинга": "Отдела маркетинга",
-        "Отдел кадров": "Отдела кадров",
-        "Юридический отдел": "Юридического отдела",
-        "Служба безопасности": "Службы безопасности",
-        "Отдел логистики": "Отдела логистики"
-    }
-
-    if name in special_cases:
-        return special_cases[name]
-
-    # Если нет в специальных случаях, добавляем стандартное окончание
-    return name + "а"
-
-
-# Создаем структуру организации
-def generate_organization_structure():
-    # Создаем компанию на русском языке
-    company = {
-        "id": str(uuid.uuid4()),
-        "name": "ООО Технопрогресс"
-    }
-
-    # Создаем отделы на русском языке
-    departments = [
-        {"id": str(uuid.uuid4()), "name": "ИТ Отдел", "company_id": company["id"]},
-        {"id": str(uuid.uuid4()), "name": "Бухгалтерия", "company_id": company["id"]},
-        {"id": str(uuid.uuid4()), "name": "Отдел разработки", "company_id": company["id"]},
-        {"id": str(uuid.uuid4()), "name": "Отдел продаж", "company_id": company["id"]},
-        {"id": str(uuid.uuid4()), "name": "Отдел маркетинга", "company_id": company["id"]},
-        {"id": str(uuid.uuid4()), "name": "Отдел кадров", "company_id": company["id"]},
-        {"id": str(uuid.uuid4()), "name": "Юридический отдел", "company_id": company["id"]},
-        {"id": str(uuid.uuid4()), "name": "Служба безопасности", "company_id": company["id"]},
-        {"id": str(uuid.uuid4()), "name": "Администрация", "company_id": company["id"]},
-        {"id": str(uuid.uuid4()), "name": "Отдел логистики", "company_id": company["id"]}
-    ]
-
-    # Создаем пользователей
-    users = []
-
-    # Пароль "test" хэшированный с SHA-256
-    hashed_password = hashlib.sha256("test".encode()).hexdigest()
-
-    # Случайное распределение пользователей по отделам
-    users_per_department = {}
-    for department in departments:
-        # Выделяем по 10 пользователей на каждый отдел
-        users_per_department[department["id"]] = 10
-
-    user_id = 0
-    # Создаем домен компании для email
-    company_domain = "techprogress.com"
-
-    for department in departments:
-        department_id = department["id"]
-        department_count = users_per_department[department_id]
-
-        # Преобразуем название отдела в slug для email (транслитерация)
-        department_slug = transliterate(department["name"].lower()).replace(' ', '_')
-
-        # Создаем пользователей для отдела
-        for i in range(department_count):
-            user_id += 1
-
-            # Первый пользователь в отделе - руководитель
-            is_leader = (i == 0)
-
-            # Генерируем данные пользователя
-            gender = 'male' if random.random() > 0.4 else 'female'  # 60% мужчин, 40% женщин
-
-            if gender == 'male':
-                first_name = fake_ru.first_name_male()
-                last_name = fake_ru.last_name_male()
-                middle_name = fake_ru.middle_name_male()
-
-                # Должности на русском
-                position_options = [
-                    "Менеджер", "Специалист", "Аналитик", "Инженер",
-                    "Программист", "Консультант", "Старший разработчик",
-                    "Технический руководитель", "Системный администратор"
-                ]
-                position = random.choice(position_options)
+import sys
+import time
+import uuid
+from typing import Dict, Iterator, List, Optional, Tuple
 
-                if is_leader:
-                    # Преобразуем название отдела в родительный падеж
-                    department_genitive = department_to_genitive(department['name'])
-                    position = f"Руководитель {department_genitive}"
-            else:
-                first_name = fake_ru.first_name_female()
-                last_name = fake_ru.last_name_female()
-                middle_name = fake_ru.middle_name_female()
-
-                # Должности на русском
-                position_options = [
-                    "Менеджер", "Специалист", "Аналитик", "Инженер",
-                    "Программист", "Консультант", "HR Специалист",
-                    "Контент-менеджер", "Бухгалтер", "Дизайнер"
-                ]
-                position = random.choice(position_options)
+from faker import Faker
 
+# Таблица транслитерации для str.translate
+TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '',
+    'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+    'А': 'A', 'Б': 'B', 'В': 'V', 'Г': 'G', 'Д': 'D', 'Е': 'E', 'Ё': 'E',
+    'Ж': 'Zh', 'З': 'Z', 'И': 'I', 'Й': 'Y', 'К': 'K', 'Л': 'L', 'М': 'M',
+    'Н': 'N', 'О': 'O', 'П': 'P', 'Р': 'R', 'С': 'S', 'Т': 'T', 'У': 'U',
+    'Ф': 'F', 'Х': 'Kh', 'Ц': 'Ts', 'Ч': 'Ch', 'Ш': 'Sh', 'Щ': 'Sch', 'Ъ': '',
+    'Ы': 'Y', 'Ь': '', 'Э': 'E', 'Ю': 'Yu', 'Я': 'Ya',
+    ' ': '_',
+})
+
+# Компании: название и домен для email; сверх списка добавляется номер
+COMPANIES = [
+    ("ООО Технопрогресс", "techprogress.com"),
+    ("АО Инфосистемы", "infosystems.com"),
+    ("ООО Северная логистика", "northlogistics.com"),
+    ("ПАО Промтехнологии", "promtech.com"),
+    ("ООО Медиагрупп", "mediagroup.com"),
+]
+
+# Отделы верхнего уровня и их названия в родительном падеже (для должности руководителя)
+DEPARTMENTS = [
+    ("ИТ Отдел", "ИТ Отдела"),
+    ("Бухгалтерия", "Бухгалтерии"),
+    ("Отдел разработки", "Отдела разработки"),
+    ("Отдел продаж", "Отдела продаж"),
+    ("Отдел маркетинга", "Отдела маркетинга"),
+    ("Отдел кадров", "Отдела кадров"),
+    ("Юридический отдел", "Юридического отдела"),
+    ("Служба безопасности", "Службы безопасности"),
+    ("Администрация", "Администрации"),
+    ("Отдел логистики", "Отдела логистики"),
+]
+
+# Подразделения вложенных уровней: уровень 1 - управления, 2 - секторы, глубже - группы
+SUBUNITS = [("Управление", "Управления"), ("Сектор", "Сектора"), ("Группа", "Группы")]
+
+POSITIONS_MALE = [
+    "Менеджер", "Специалист", "Аналитик", "Инженер",
+    "Программист", "Консультант", "Старший разработчик",
+    "Технический руководитель", "Системный администратор"
+]
+POSITIONS_FEMALE = [
+    "Менеджер", "Специалист", "Аналитик", "Инженер",
+    "Программист", "Консультант", "HR Специалист",
+    "Контент-менеджер", "Бухгалтер", "Дизайнер"
+]
+
+COMPANY_FIELDS = ("id", "name")
+DEPARTMENT_FIELDS = ("id", "name", "company_id", "parent_id")
+USER_FIELDS = ("id", "email", "org_email", "name", "surname", "patronymic", "position", "hashed_password",
+               "EtudeID", "department_id", "is_leader")
+
+CHUNK_SIZE = 10000  # Записей в одной операции записи в файл
+
+
+def transliterate(name: str) -> str:
+    return name.translate(TRANSLIT)
+
+
+class NamePool(dict):
+    """Имена, заранее выбранные из Faker и уже транслитерированные: имя -> латиница"""
+
+    def __init__(self, generate, size: int):
+        super().__init__((name, transliterate(name).lower()) for name in (generate() for _ in range(size)))
+        self.names = list(self)
+
+
+class OrganizationGenerator:
+    """Детерминированный генератор компаний, иерархии отделов и сотрудников.
+
+    Faker вызывается только для заполнения пулов имен при создании генератора; сотрудники
+    собираются из пулов, поэтому миллионы записей генерируются за секунды.
+    Уникальность email обеспечивается счетчиками по базовому адресу внутри компании, без общего набора адресов.
+    """
+
+    def __init__(self, seed: int, departments: int, depth: int, branching: int, users_per_department: int,
+                 password: str, name_pool_size: int = 500):
+        self.rng = random.Random(seed)
+        self.departments = departments
+        self.depth = depth
+        self.branching = branching
+        self.users_per_department = users_per_department
+        # Пароль хэшированный с SHA-256 (при первом входе заменяется на bcrypt)
+        self.hashed_password = hashlib.sha256(password.encode()).hexdigest()
+
+        fake = Faker('ru_RU')
+        fake.seed_instance(seed)
+        self.male = (NamePool(fake.first_name_male, name_pool_size), NamePool(fake.last_name_male, name_pool_size),
+                     NamePool(fake.middle_name_male, name_pool_size))
+        self.female = (NamePool(fake.first_name_female, name_pool_size),
+                       NamePool(fake.last_name_female, name_pool_size),
+                       NamePool(fake.middle_name_female, name_pool_size))
+
+    def new_id(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def company(self, index: int) -> Tuple[dict, str]:
+        name, domain = COMPANIES[index % len(COMPANIES)]
+        if index >= len(COMPANIES):
+            number = index // len(COMPANIES) + 1
+            name, domain = f"{name} {number}", f"{number}.{domain}"
+        return {"id": self.new_id(), "name": name}, domain
+
+    def iter_departments(self, company_id: str) -> Iterator[Tuple[dict, str]]:
+        """Отделы в порядке обхода в глубину: (запись, название в родительном падеже)"""
+        def walk(parent: Optional[dict], path: str, level: int):
+            kind, kind_genitive = SUBUNITS[min(level, len(SUBUNITS)) - 1]
+            for i in range(1, self.branching + 1):
+                record = {"id": self.new_id(), "name": f"{path} / {kind} {i}", "company_id": company_id,
+                          "parent_id": parent["id"]}
+                yield record, f"{kind_genitive} {i}"
+                if level < self.depth - 1:
+                    yield from walk(record, record["name"], level + 1)
+
+        for i in range(self.departments):
+            name, genitive = DEPARTMENTS[i % len(DEPARTMENTS)]
+            if i >= len(DEPARTMENTS):
+                suffix = f" {i // len(DEPARTMENTS) + 1}"
+                name, genitive = name + suffix, genitive + suffix
+            record = {"id": self.new_id(), "name": name, "company_id": company_id, "parent_id": None}
+            yield record, genitive
+            if self.depth > 1:
+                yield from walk(record, name, 1)
+
+    def iter_users(self, departments: List[Tuple[dict, str]], domain: str) -> Iterator[dict]:
+        rng = self.rng
+        used: Dict[str, int] = {}
+
+        def unique_email(local: str) -> str:
+            # Базовые адреса содержат ровно одну точку, поэтому адрес с суффиксом ".N" не совпадет с другим
+            count = used.get(local, 0)
+            used[local] = count + 1
+            return f"{local}.{count}@{domain}" if count else f"{local}@{domain}"
+
+        for department, genitive in departments:
+            slug = transliterate(department["name"].rsplit(" / ", 1)[-1]).lower()
+            for i in range(self.users_per_department):
+                # 60% мужчин, 40% женщин
+                male = rng.random() > 0.4
+                first_names, last_names, middle_names = self.male if male else self.female
+                first_name = rng.choice(first_names.names)
+                last_name = rng.choice(last_names.names)
+                position = rng.choice(POSITIONS_MALE if male else POSITIONS_FEMALE)
+
+                # Первый сотрудник отдела - руководитель
+                is_leader = i == 0
                 if is_leader:
-                    # Преобразуем название отдела в родительный падеж
-                    department_genitive = department_to_genitive(department['name'])
-                    position = f"Руководитель {department_genitive}"
-
-            # Создаем email с английскими буквами и гарантируем уникальность
-            first_name_latin = transliterate(first_name).lower()
-            last_name_latin = transliterate(last_name).lower()
-
-            # Создаем базовый email
-            if is_leader:
-                base_email = f"head.{department_slug}@{company_domain}"
-            else:
-                base_email = f"{first_name_latin}.{last_name_latin}@{company_domain}"
-
-            # Проверяем и гарантируем уникальность email
-            email = base_email
-            counter = 1
-            while email in used_emails:
-                if is_leader:
-                    # Для руководителей добавляем номер департамента
-                    email = f"head.{department_slug}{counter}@{company_domain}"
+                    email = unique_email(f"head.{slug}")
+                    position = f"Руководитель {genitive}"
                 else:
-                    # Для обычных сотрудников добавляем числовой суффикс
-                    email = f"{first_name_latin}.{last_name_latin}{counter}@{company_domain}"
-                counter += 1
-
-            # Добавляем email в список использованных
-            used_emails.add(email)
-
-            user = {
-                "id": str(uuid.uuid4()),
-                "email": email,
-                "org_email": email,
-                "name": first_name,
-                "surname": last_name,
-                "patronymic": middle_name,
-                "position": position,
-                "hashed_password": hashed_password,
-                "EtudeID": None,
-                "department_id": department_id,
-                "is_leader": is_leader
-            }
-
-            users.append(user)
-
-    # Проверяем, что все email-адреса уникальны
-    email_set = set()
-    duplicates = []
-    for user in users:
-        email = user["email"]
-        if email in email_set:
-            duplicates.append(email)
-        email_set.add(email)
-
-    if duplicates:
-        print(f"ВНИМАНИЕ: Обнаружены дубликаты email-адресов: {duplicates}")
-    else:
-        print(f"Проверка успешна: все {len(users)} email-адресов уникальны")
-
-    # Формируем итоговую структуру
-    organization_data = {
-        "company": company,
-        "departments": departments,
-        "users": users
-    }
-
-    return organization_data
-
-
-# Генерируем структуру организации
-organization = generate_organization_structure()
-
-# Сохраняем в JSON файл
-with open('organization_data.json', 'w', encoding='utf-8') as f:
-    json.dump(organization, f, ensure_ascii=False, indent=4)
-
-print(f"Файл organization_data.json создан успешно с {len(organization['users'])} пользователями")
\ No newline at end of file
+                    email = unique_email(f"{first_names[first_name]}.{last_names[last_name]}")
+
+                yield {
+                    "id": self.new_id(),
+                    "email": email,
+                    "org_email": email,
+                    "name": first_name,
+                    "surname": last_name,
+                    "patronymic": rng.choice(middle_names.names),
+                    "position": position,
+                    "hashed_password": self.hashed_password,
+                    "EtudeID": None,
+                    "department_id": department["id"],
+                    "is_leader": is_leader,
+                }
+
+    def iter_records(self, companies: int) -> Iterator[Tuple[str, dict]]:
+        """Все записи по порядку: компания, ее отделы, затем ее сотрудники"""
+        for index in range(companies):
+            company, domain = self.company(index)
+            yield "company", company
+            departments = list(self.iter_departments(company["id"]))
+            for department, _ in departments:
+                yield "department", department
+            for user in self.iter_users(departments, domain):
+                yield "user", user
+
+
+class JsonWriter:
+    """Структура {"company", "departments", "users"}, которую читает import_organization.py"""
+
+    def __init__(self, path: str):
+        self.f = open(path, "w", encoding="utf-8")
+        self.buffer: List[str] = []
+        self.section: Optional[str] = None
+        self.first_in_section = True
+
+    def write(self, kind: str, record: dict):
+        if kind == "company":
+            if self.section is not None:
+                raise ValueError("Формат json поддерживает только одну компанию - используйте ndjson или csv")
+            self.buffer.append('{"company": ' + json.dumps(record, ensure_ascii=False))
+            self.section = kind
+            return
+        if kind != self.section:
+            self.buffer.append("" if self.section == "company" else "\n]")
+            self.buffer.append(f', "{kind}s": [\n')
+            self.section, self.first_in_section = kind, True
+        self.buffer.append(("" if self.first_in_section else ",\n") + json.dumps(record, ensure_ascii=False))
+        self.first_in_section = False
+        if len(self.buffer) >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.f.write("".join(self.buffer))
+        self.buffer = []
+
+    def close(self):
+        if self.section == "department":
+            self.buffer.append('\n], "users": [')
+        self.buffer.append("\n]}\n" if self.section in ("department", "user") else "}\n")
+        self.flush()
+        self.f.close()
+
+
+class NdjsonWriter:
+    def __init__(self, path: str):
+        self.f = open(path, "w", encoding="utf-8")
+        self.buffer: List[str] = []
+
+    def write(self, kind: str, record: dict):
+        self.buffer.append(json.dumps({"type": kind, **record}, ensure_ascii=False))
+        if len(self.buffer) >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.f.write("\n".join(self.buffer) + "\n")
+            self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+
+class CsvWriter:
+    """Каталог с файлом на каждую таблицу; порядок столбцов как в FIELDS"""
+
+    FILES = {"company": ("companies.csv", COMPANY_FIELDS), "department": ("departments.csv", DEPARTMENT_FIELDS),
+             "user": ("users.csv", USER_FIELDS)}
+
+    def __init__(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        self.files, self.writers, self.buffers = {}, {}, {}
+        for kind, (name, fields) in self.FILES.items():
+            self.files[kind] = open(os.path.join(path, name), "w", encoding="utf-8", newline="")
+            self.writers[kind] = csv.writer(self.files[kind])
+            self.writers[kind].writerow(fields)
+            self.buffers[kind] = []
+
+    def write(self, kind: str, record: dict):
+        buffer = self.buffers[kind]
+        buffer.append([record[field] for field in self.FILES[kind][1]])
+        if len(buffer) >= CHUNK_SIZE:
+            self.writers[kind].writerows(buffer)
+            buffer.clear()
+
+    def close(self):
+        for kind, f in self.files.items():
+            self.writers[kind].writerows(self.buffers[kind])
+            f.close()
+
+
+WRITERS = {"json": JsonWriter, "ndjson": NdjsonWriter, "csv": CsvWriter}
+DEFAULT_OUTPUT = {"json": "organization_data.json", "ndjson": "organization_data.ndjson",
+                  "csv": "organization_data_csv"}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Генерация синтетической организационной структуры")
+    parser.add_argument("--companies", type=int, default=1)
+    parser.add_argument("--departments", type=int, default=10, help="Отделов верхнего уровня в компании")
+    parser.add_argument("--depth", type=int, default=1, help="Уровней иерархии отделов (1 - без вложенных)")
+    parser.add_argument("--branching", type=int, default=3, help="Дочерних подразделений у каждого отдела")
+    parser.add_argument("--users-per-department", type=int, default=10)
+    parser.add_argument("--format", choices=sorted(WRITERS), default="json")
+    parser.add_argument("--output", help="Файл (json, ndjson) или каталог (csv)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--password", default="test", help="Пароль всех сотрудников")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.format == "json" and args.companies > 1:
+        sys.exit("Формат json поддерживает только одну компанию - используйте ndjson или csv")
+    output = args.output or DEFAULT_OUTPUT[args.format]
+
+    generator = OrganizationGenerator(args.seed, args.departments, args.depth, args.branching,
+                                      args.users_per_department, args.password)
+    writer = WRITERS[args.format](output)
+    counts = {"company": 0, "department": 0, "user": 0}
+    started = time.perf_counter()
+    try:
+        for kind, record in generator.iter_records(args.companies):
+            writer.write(kind, record)
+            counts[kind] += 1
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"{output}: компаний {counts['company']}, отделов {counts['department']}, "
+          f"сотрудников {counts['user']} за {elapsed:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+from typing import Callable, Optional
+
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+
+from db import async_session_factory
+
+MAX_PAGE_SIZE = 1000  # Максимальный размер страницы
+STREAM_BATCH_SIZE = 1000  # Строк, получаемых из серверного курсора за раз
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def keyset_page(query, column, after, limit: Optional[int]):
+    """Страница по ключу: строки после курсора в порядке индексированного столбца.
+
+    В отличие от OFFSET, стоимость не растет с номером страницы.
+    """
+    if after is not None:
+        query = query.where(column > after)
+    return query.order_by(column).limit(limit)
+
+
+def set_next_cursor(response: Response, items: list, limit: int, cursor: Callable = lambda item: item.id):
+    """Передает курсор следующей страницы в заголовке; тело ответа остается списком"""
+    if items and len(items) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = str(cursor(items[-1]))
+
+
+def ndjson_response(query, serialize: Callable, scalars: bool = True) -> StreamingResponse:
+    """Выгрузка результата запроса в NDJSON через серверный курсор с постоянным расходом памяти.
+
+    Сессия открывается внутри генератора: сессия запроса закрывается до отправки тела ответа.
+    """
+    async def lines():
+        async with async_session_factory() as session:
+            query_with_cursor = query.execution_options(yield_per=STREAM_BATCH_SIZE)
+            if scalars:
+                result = await session.stream_scalars(query_with_cursor)
+            else:
+                result = await session.stream(query_with_cursor)
+            async for partition in result.partitions():
+                yield "".join(serialize(row) + "\n" for row in partition)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
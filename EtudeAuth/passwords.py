@@ -0,0 +1,88 @@
+import asyncio
+import hashlib
+import hmac
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+import bcrypt
+
+# bcrypt учитывает только первые 72 байта пароля
+BCRYPT_MAX_PASSWORD_BYTES = 72
+LEGACY_SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class PasswordHasher:
+    """Хэширование паролей bcrypt вне цикла событий.
+
+    bcrypt отпускает GIL, поэтому вычисления выполняются в ограниченном пуле потоков.
+    Семафор ограничивает число одновременных хэширований: при всплеске входов запросы
+    ждут своей очереди, а цикл событий остается свободным для проверки токенов.
+    Старые хэши SHA-256 принимаются и заменяются на bcrypt при следующем входе.
+    """
+
+    def __init__(self):
+        self.rounds: Optional[int] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def start(self, rounds: int, max_workers: int, max_concurrency: int):
+        self.rounds = rounds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    @staticmethod
+    def _encode(password: str) -> bytes:
+        return password.encode()[:BCRYPT_MAX_PASSWORD_BYTES]
+
+    @staticmethod
+    def is_legacy(hashed: str) -> bool:
+        return bool(LEGACY_SHA256_PATTERN.match(hashed))
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """Хэш устарел: SHA-256 или bcrypt с другой стоимостью"""
+        if self.is_legacy(hashed):
+            return True
+        try:
+            return int(hashed.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def hash_sync(self, password: str) -> str:
+        return bcrypt.hashpw(self._encode(password), bcrypt.gensalt(rounds=self.rounds)).decode()
+
+    def verify_sync(self, password: str, hashed: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """Проверяет пароль; при успехе для устаревшего хэша возвращает новый"""
+        if not hashed:
+            return False, None
+
+        if self.is_legacy(hashed):
+            valid = hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), hashed)
+        else:
+            try:
+                valid = bcrypt.checkpw(self._encode(password), hashed.encode())
+            except ValueError:
+                return False, None
+
+        if valid and self.needs_rehash(hashed):
+            return True, self.hash_sync(password)
+        return valid, None
+
+    async def _run(self, func, *args):
+        async with self._semaphore:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.hash_sync, password)
+
+    async def verify(self, password: str, hashed: Optional[str]) -> Tuple[bool, Optional[str]]:
+        return await self._run(self.verify_sync, password, hashed)
+
+    def stop(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Пул потоков и стоимость задаются при старте воркера (start в lifespan)
+password_hasher = PasswordHasher()
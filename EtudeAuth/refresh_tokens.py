@@ -0,0 +1,116 @@
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, select, or_, not_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from db import async_session_factory, RefreshToken
+
+logger = logging.getLogger(__name__)
+
+
+def hash_refresh_token(token: str) -> bytes:
+    """В базе хранится только SHA-256 от токена фиксированной длины"""
+    return hashlib.sha256(token.encode()).digest()
+
+
+def new_refresh_token_row(token: str, email: str, scopes: str, client_id: str, user_id=None) -> RefreshToken:
+    now = datetime.utcnow()
+    return RefreshToken(
+        token_hash=hash_refresh_token(token),
+        user_id=user_id,
+        email=email,
+        scopes=scopes,
+        client_id=client_id,
+        expires_at=now + timedelta(seconds=settings.JWT_REFRESH_TTL),
+        created_at=now,
+        revoked=False
+    )
+
+
+def consume_refresh_token_statement(token_hash: bytes, client_id: str):
+    """DELETE ... RETURNING действующего токена клиента.
+
+    Условие NOT revoked совпадает с условием частичного индекса ix_refresh_tokens_active_token_hash
+    (с revoked IS false планировщик индекс не использует).
+    """
+    return (
+        delete(RefreshToken)
+        .where(
+            RefreshToken.token_hash == token_hash,
+            not_(RefreshToken.revoked),
+            RefreshToken.expires_at > datetime.utcnow(),
+            RefreshToken.client_id == client_id
+        )
+        .returning(RefreshToken.user_id, RefreshToken.email, RefreshToken.scopes)
+    )
+
+
+async def consume_refresh_token(db: AsyncSession, token: Optional[str], client_id: str):
+    """Погашает действующий refresh токен клиента для ротации одним DELETE ... RETURNING.
+
+    Токен можно использовать только один раз: взамен выдается новый.
+    Возвращает (user_id, email, scopes) или None.
+    """
+    if not token:
+        return None
+
+    result = await db.execute(consume_refresh_token_statement(hash_refresh_token(token), client_id))
+    return result.first()
+
+
+async def delete_refresh_token(db: AsyncSession, token: str) -> bool:
+    result = await db.execute(delete(RefreshToken).where(RefreshToken.token_hash == hash_refresh_token(token)))
+    return result.rowcount > 0
+
+
+class RefreshTokenCollector:
+    """Периодически удаляет истекшие и отозванные refresh токены пачками"""
+
+    def __init__(self):
+        self.interval = None
+        self.batch_size = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def collect(self) -> int:
+        deleted = 0
+        while True:
+            async with async_session_factory() as session:
+                stale = (
+                    select(RefreshToken.id)
+                    .where(or_(RefreshToken.revoked.is_(True), RefreshToken.expires_at <= datetime.utcnow()))
+                    .limit(self.batch_size)
+                    .with_for_update(skip_locked=True)
+                )
+                result = await session.execute(
+                    delete(RefreshToken)
+                    .where(RefreshToken.id.in_(stale))
+                    .execution_options(synchronize_session=False)
+                )
+                await session.commit()
+
+            deleted += result.rowcount
+            if result.rowcount < self.batch_size:
+                return deleted
+
+    async def _run(self):
+        while True:
+            try:
+                await self.collect()
+            except Exception:
+                logger.exception("Refresh token collection failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self, interval: float, batch_size: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
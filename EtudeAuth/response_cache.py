@@ -0,0 +1,67 @@
+import hashlib
+import json
+import time
+from typing import Optional
+
+
+class CachedBody:
+    """Сериализованное тело ответа и его ETag"""
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверка If-None-Match: список ETag через запятую или *, сравнение слабое (без W/)"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class JsonResponseCache:
+    """Кэш одного JSON-ответа с версией и временем жизни.
+
+    ETag вычисляется по содержимому, поэтому совпадает на всех воркерах.
+    Версия увеличивается при каждой инвалидации: результат, построенный до нее,
+    не попадает в кэш. Кэш локален для воркера; изменения, сделанные другими воркерами,
+    доставляются через invalidate() по NOTIFY, а без него - по истечении ttl.
+    """
+
+    def __init__(self, ttl: float = 0.0):
+        self.ttl = ttl
+        self.version = 0
+        self._entry: Optional[CachedBody] = None
+        self._expires_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, ttl: float):
+        self.ttl = ttl
+        self.invalidate()
+
+    def get(self) -> Optional[CachedBody]:
+        if self._entry is not None and self._expires_at > time.monotonic():
+            self.hits += 1
+            return self._entry
+        self.misses += 1
+        return None
+
+    def store(self, data, version: int) -> CachedBody:
+        entry = CachedBody(json.dumps(data, ensure_ascii=False, default=str).encode())
+        if version == self.version:
+            self._entry = entry
+            self._expires_at = time.monotonic() + self.ttl
+        return entry
+
+    def invalidate(self):
+        self.version += 1
+        self._entry = None
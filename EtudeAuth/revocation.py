@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import logging
+import math
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, delete, exists
+from sqlalchemy.dialects.postgresql import insert
+
+from db import async_session_factory, RevokedToken
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Компактный вероятностный фильтр: отвечает "точно нет" или "возможно да" """
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        for position in self._positions(key):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class MemoryRevocationBackend:
+    """Локальное хранилище отзывов (для разработки и одного воркера)"""
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[int, datetime]] = {}
+        self._cursor = 0
+
+    async def add(self, jti: str, expires_at: datetime):
+        if jti not in self._entries:
+            self._cursor += 1
+            self._entries[jti] = (self._cursor, expires_at)
+
+    async def contains(self, jti: str) -> bool:
+        entry = self._entries.get(jti)
+        return entry is not None and entry[1] > datetime.utcnow()
+
+    async def fetch_since(self, cursor: int) -> Tuple[List[Tuple[int, str]], int]:
+        now = datetime.utcnow()
+        entries = [(entry_id, jti) for jti, (entry_id, expires_at) in self._entries.items()
+                   if entry_id > cursor and expires_at > now]
+        return entries, self._cursor
+
+    async def purge_expired(self) -> int:
+        now = datetime.utcnow()
+        expired = [jti for jti, (_, expires_at) in self._entries.items() if expires_at <= now]
+        for jti in expired:
+            del self._entries[jti]
+        return len(expired)
+
+
+class DatabaseRevocationBackend:
+    """Хранилище отзывов в таблице revoked_tokens, общее для всех воркеров"""
+
+    async def add(self, jti: str, expires_at: datetime):
+        stmt = insert(RevokedToken).values(jti=jti, expires_at=expires_at) \
+            .on_conflict_do_nothing(index_elements=[RevokedToken.jti])
+        async with async_session_factory() as session:
+            await session.execute(stmt)
+            await session.commit()
+
+    async def contains(self, jti: str) -> bool:
+        stmt = select(exists().where(
+            (RevokedToken.jti == jti) & (RevokedToken.expires_at > datetime.utcnow())
+        ))
+        async with async_session_factory() as session:
+            return bool(await session.scalar(stmt))
+
+    async def fetch_since(self, cursor: int) -> Tuple[List[Tuple[int, str]], int]:
+        stmt = select(RevokedToken.id, RevokedToken.jti).where(
+            (RevokedToken.id > cursor) & (RevokedToken.expires_at > datetime.utcnow())
+        ).order_by(RevokedToken.id)
+        async with async_session_factory() as session:
+            rows = (await session.execute(stmt)).all()
+        if rows:
+            cursor = rows[-1].id
+        return [(row.id, row.jti) for row in rows], cursor
+
+    async def purge_expired(self) -> int:
+        stmt = delete(RevokedToken).where(RevokedToken.expires_at <= datetime.utcnow())
+        async with async_session_factory() as session:
+            result = await session.execute(stmt)
+            await session.commit()
+        return result.rowcount or 0
+
+
+class RevocationStore:
+    """Отозванные токены: общий бэкенд и локальный bloom-фильтр в каждом воркере.
+
+    Id из последовательности выдаются при вставке, а видны после commit, поэтому строка
+    с меньшим id может появиться позже строки с большим. Синхронизация каждый раз
+    перечитывает последние overlap id за курсором и пропускает уже учтенные.
+    """
+
+    def __init__(self):
+        self.backend = None
+        self.capacity = 0
+        self.error_rate = 0.0
+        self.overlap = 0
+        self.bloom: Optional[BloomFilter] = None
+        self._cursor = 0
+        self._seen = set()  # Учтенные id в окне перечитывания
+        self._task: Optional[asyncio.Task] = None
+
+    def configure(self, backend, capacity: int, error_rate: float, overlap: int):
+        self.backend = backend
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.overlap = overlap
+        self.bloom = BloomFilter(capacity, error_rate)
+        self._cursor = 0
+        self._seen = set()
+
+    def might_be_revoked(self, jti: str) -> bool:
+        """Быстрая проверка без обращения к бэкенду: False означает "точно не отозван" """
+        return self.bloom is not None and jti in self.bloom
+
+    async def is_revoked(self, jti: Optional[str]) -> bool:
+        if not jti or not self.might_be_revoked(jti):
+            return False
+        # Фильтр мог ошибиться - подтверждаем по бэкенду
+        return await self.backend.contains(jti)
+
+    async def revoke(self, jti: str, expires_at: datetime):
+        await self.backend.add(jti, expires_at)
+        self.bloom.add(jti)
+
+    async def refresh(self):
+        """Добавляет в фильтр отзывы, сделанные другими воркерами с прошлой синхронизации"""
+        entries, cursor = await self.backend.fetch_since(max(self._cursor - self.overlap, 0))
+        for entry_id, jti in entries:
+            if entry_id not in self._seen:
+                self.bloom.add(jti)
+                self._seen.add(entry_id)
+        self._cursor = max(self._cursor, cursor)
+        self._seen = {entry_id for entry_id in self._seen if entry_id > self._cursor - self.overlap}
+
+    async def rebuild(self):
+        """Удаляет истекшие записи и пересобирает фильтр с нуля"""
+        await self.backend.purge_expired()
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        entries, cursor = await self.backend.fetch_since(0)
+        for _, jti in entries:
+            bloom.add(jti)
+        self.bloom, self._cursor = bloom, cursor
+        self._seen = {entry_id for entry_id, _ in entries if entry_id > cursor - self.overlap}
+
+    async def _run(self, refresh_interval: float, rebuild_interval: float):
+        loop = asyncio.get_running_loop()
+        next_rebuild = loop.time() + rebuild_interval
+        while True:
+            await asyncio.sleep(refresh_interval)
+            try:
+                if loop.time() >= next_rebuild:
+                    await self.rebuild()
+                    next_rebuild = loop.time() + rebuild_interval
+                else:
+                    await self.refresh()
+            except Exception:
+                logger.exception("Revocation sync failed")
+
+    async def start(self, refresh_interval: float, rebuild_interval: float):
+        await self.rebuild()
+        self._task = asyncio.create_task(self._run(refresh_interval, rebuild_interval))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+
+def create_backend(name: str):
+    if name == "memory":
+        return MemoryRevocationBackend()
+    return DatabaseRevocationBackend()
+
+
+# Бэкенд и размер фильтра задаются при старте воркера (configure в lifespan)
+revocation_store = RevocationStore()
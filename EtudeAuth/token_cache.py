@@ -0,0 +1,62 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+
+class TokenCache:
+    """LRU-кэш проверенных access токенов: дайджест токена -> TokenData до момента exp"""
+
+    def __init__(self, maxsize: int = 0):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, maxsize: int):
+        self.maxsize = maxsize
+        self.clear()
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, key: bytes):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        token_data, expires_at = entry
+        if expires_at <= time.time():
+            # Срок действия истек - запись больше не нужна
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return token_data
+
+    def put(self, key: bytes, token_data, expires_at: float):
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = (token_data, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, token: str):
+        self._entries.pop(self.key(token), None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0
+        }
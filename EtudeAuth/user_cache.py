@@ -0,0 +1,91 @@
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+
+class UserCache:
+    """LRU кэш пользователей по email и id с коротким временем жизни записей.
+
+    Хранится неизменяемый снимок столбцов, а не объект ORM: объект привязан к сессии,
+    в которой был загружен. На каждое попадание создается новый отсоединенный экземпляр,
+    который вызывающий код присоединяет к своей сессии через merge(load=False).
+    """
+
+    def __init__(self, ttl: float = 0.0, maxsize: int = 0):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._by_email = OrderedDict()  # Порядок ключей - порядок последнего использования
+        self._by_id = {}
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.clear()
+
+    def _get(self, mapping, key):
+        entry = mapping.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        model, values, expires_at = entry
+        if expires_at <= time.monotonic():
+            self.invalidate(email=values["email"], user_id=values["id"])
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._by_email.move_to_end(values["email"])
+
+        user = model(**values)
+        make_transient_to_detached(user)
+        return user
+
+    def get_by_email(self, email: str):
+        return self._get(self._by_email, email)
+
+    def get_by_id(self, user_id):
+        return self._get(self._by_id, user_id)
+
+    def put(self, user):
+        if self.ttl <= 0 or self.maxsize <= 0:
+            return
+        # Старая запись могла остаться под прежним email
+        self.invalidate(user)
+
+        mapper = inspect(type(user))
+        loaded = inspect(user).dict
+        keys = [attr.key for attr in mapper.column_attrs]
+        if any(key not in loaded for key in keys):
+            # Часть столбцов истекла (например, после commit) - без запроса к БД их не прочитать
+            return
+        values = MappingProxyType({key: loaded[key] for key in keys})
+
+        entry = (type(user), values, time.monotonic() + self.ttl)
+        self._by_email[values["email"]] = entry
+        self._by_id[values["id"]] = entry
+        while len(self._by_email) > self.maxsize:
+            _, (_, oldest, _) = self._by_email.popitem(last=False)
+            self._by_id.pop(oldest["id"], None)
+
+    def invalidate(self, user=None, email: str = None, user_id=None):
+        """Удаляет пользователя из кэша по объекту, email или id"""
+        if user is not None:
+            # Из состояния объекта: у истекшего объекта чтение атрибута обратилось бы к БД
+            state = inspect(user)
+            email = email or state.dict.get("email")
+            user_id = user_id or state.dict.get("id") or (state.identity[0] if state.identity else None)
+
+        for entry in (self._by_email.get(email), self._by_id.get(user_id)):
+            if entry is not None:
+                values = entry[1]
+                self._by_email.pop(values["email"], None)
+                self._by_id.pop(values["id"], None)
+
+    def clear(self):
+        self._by_email.clear()
+        self._by_id.clear()